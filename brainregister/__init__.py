@@ -12,16 +12,270 @@ __author__ = 'Steven J. West'
 
 # package imports
 import os
-import glob
 import sys
-import gc
+import copy
+import itertools
+import io
+import re
+import contextlib
+import functools
+import shutil
+import tempfile
+import threading
+import weakref
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
 import yaml # pyyaml library
-from pathlib import Path
+from pathlib import Path, PurePath
 import SimpleITK as sitk #SimpleITK-elastix package
 
+# use the libyaml C loader/dumper if pyyaml was built with it - much FASTER
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
  # get the module directory - to point to resources/ and other package artifacts
 BRAINREGISTER_MODULE_DIR = os.path.abspath( os.path.dirname(__file__) )
 
+# scaling transformix pm file - template for all raw <-> downsampled transforms
+_SCALING_PM_PATH = os.path.join(BRAINREGISTER_MODULE_DIR, 'resources',
+                                'transformix-parameter-files', '00_scaling.txt')
+
+# unit voxel spacing - images are registered in voxel space
+_UNIT_SPACING = (1.0, 1.0, 1.0)
+
+# zero origin and identity direction - geometry of images built from arrays
+_ZERO_ORIGIN = (0.0, 0.0, 0.0)
+_UNIT_DIRECTION = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+
+# gzip compression level for saved images - 1 is FAST, 9 is smallest
+_COMPRESSION_LEVEL = 1
+
+# numpy dtype to cast to for each sitk pixel type - anything else is cast to uint16
+_SITK_TO_NP = {
+    sitk.sitkInt16 : 'int16',
+    sitk.sitkInt8 : 'int8',
+    sitk.sitkUInt8 : 'uint8',
+    sitk.sitkUInt16 : 'uint16',
+    }
+
+# label images remapped to uint16 label indices for nearest neighbour transforms
+ # elastix resamples in float32 - exact only for integer labels up to 2**24
+_LABEL_REMAP_TYPES = frozenset( (sitk.sitkUInt32, sitk.sitkUInt64) )
+_LABEL_REMAP_MAX = 2**16 # most distinct labels a uint16 index can hold
+
+# background image writes in flight - each holds its image in memory until written
+_IMAGE_WRITERS = max(1, min(4, os.cpu_count() or 1))
+
+# ITK thread count set by _configure_sitk_threads() - None until configured
+_SITK_THREADS = None
+
+# parsed yaml template files - keyed by (path, modification time)
+_TEMPLATE_CACHE = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _read_parameter_file_cached(pm_path, mtime_ns):
+    # mtime_ns in the key - so an edited file is read again
+    return sitk.ReadParameterFile(pm_path)
+
+
+def _read_parameter_file(pm_path):
+    # read each elastix/transformix parameter file ONCE per process
+     # return a COPY - callers edit the returned map (eg. TransformParameters, Size)
+    pm_path = str(pm_path)
+    return sitk.ParameterMap( _read_parameter_file_cached(
+                                    pm_path, os.stat(pm_path).st_mtime_ns) )
+
+
+# sitk ParameterMap values MUST be strings - it rejects tuples of floats
+_ZERO_PARAMETER = '0.000000'
+
+
+def _scaling_parameters(scale_xyz):
+    # affine TransformParameters for a pure XYZ scaling - 6 dp, as used by elastix
+    x, y, z = ( f"{f:.6f}" for f in scale_xyz.tolist() )
+    o = _ZERO_PARAMETER
+    return ( x, o, o, o, 
+             y, o, o, o, 
+             z, o, o, o )
+
+
+def _size_parameters(size_xyz):
+    # Size parameter - each dimension rounded to whole voxels
+    return tuple( f"{round(v):.6f}" for v in size_xyz.tolist() )
+
+
+# transformix FinalBSplineInterpolationOrder : the matching sitk interpolator
+_BSPLINE_ORDER_INTERPOLATOR = {
+    '0' : sitk.sitkNearestNeighbor,
+    '1' : sitk.sitkBSpline1, # NOT sitkLinear - which differs within half a voxel of the border
+    '2' : sitk.sitkBSpline2,
+    '3' : sitk.sitkBSpline3,
+    '4' : sitk.sitkBSpline4,
+    '5' : sitk.sitkBSpline5,
+    }
+
+
+def _resample_interpolator(pm):
+    # sitk interpolator equivalent to the transformix resample interpolator of pm
+     # None if there is no equivalent - the pm list must then use transformix
+    interpolator = pm['ResampleInterpolator'][0] if 'ResampleInterpolator' in pm else ''
+    if interpolator == 'FinalBSplineInterpolator':
+        order = pm['FinalBSplineInterpolationOrder'][0] if 'FinalBSplineInterpolationOrder' in pm else '3'
+        return _BSPLINE_ORDER_INTERPOLATOR.get(order)
+    if interpolator == 'FinalNearestNeighborInterpolator':
+        return sitk.sitkNearestNeighbor
+    if interpolator == 'FinalLinearInterpolator':
+        return sitk.sitkLinear
+    return None
+
+
+# bytes per output voxel to keep a displacement field - the float32 field from 
+ # transformix and the float64 copy DisplacementFieldTransform needs
+_DISPLACEMENT_FIELD_BYTES = 36
+
+# tolerance of a displacement field resample against the transformix result - 
+ # float32 rounding of the field shifts interpolated values only slightly
+_DISPLACEMENT_FIELD_RTOL = 1e-5
+_DISPLACEMENT_FIELD_ATOL = 1e-2
+
+
+def _same_resample(img_a, img_b):
+    # True if two float32 resamples of one image agree to the tolerance above
+     # compared in slabs of slices - np.allclose makes full-size temporaries
+    a = sitk.GetArrayViewFromImage(img_a)
+    b = sitk.GetArrayViewFromImage(img_b)
+    if a.shape != b.shape:
+        return False
+    return all( np.allclose(b[z:z+16], a[z:z+16], rtol = _DISPLACEMENT_FIELD_RTOL, 
+                            atol = _DISPLACEMENT_FIELD_ATOL)
+                for z in range(0, a.shape[0], 16) )
+
+
+# elastix writes the path of the previous pm file into each chained pm file
+_INITIAL_TRANSFORM_RE = re.compile(r'\(InitialTransformParameterFileName "[^"]*"\)')
+
+
+# sitk ImageIO for common image file suffixes - others use the IO factory
+_SUFFIX_IMAGE_IO = {
+    '.nrrd' : 'NrrdImageIO',
+    '.nhdr' : 'NrrdImageIO',
+    '.nii' : 'NiftiImageIO',
+    '.nii.gz' : 'NiftiImageIO',
+    '.mha' : 'MetaImageIO',
+    '.mhd' : 'MetaImageIO',
+    '.tif' : 'TIFFImageIO',
+    '.tiff' : 'TIFFImageIO',
+    }
+
+
+def _image_io_for(path):
+    name = PurePath(path).name.lower()
+    if name.endswith('.nii.gz'):
+        return _SUFFIX_IMAGE_IO['.nii.gz']
+    return _SUFFIX_IMAGE_IO.get(PurePath(name).suffix, '')
+
+
+def _read_image(path):
+    # read the WHOLE image - every transform/filter downstream needs the full 
+     # pixel buffer, so a streamed (region by region) read would not lower the peak
+    path = str(path)
+    if hasattr(os, 'posix_fadvise'):
+        # ask the kernel to start reading the file into the page cache now - 
+         # overlaps the disk read with ITK parsing the header & allocating the buffer
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass # only a hint - ITK reports any real read error below
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.SetImageIO( _image_io_for(path) )
+    return reader.Execute()
+
+
+def _report_image_write(path):
+    # done callback of a background write - report a failed write as soon as it 
+     # fails, the error is raised again when the write is waited on
+    def report(future):
+        if future.exception() is not None:
+            print('')
+            print(f'\033[1;31m ERROR :  writing image failed : {path} : '
+                  f'{future.exception()} \033[0;0m')
+            print('')
+    return report
+
+
+# BrainRegister instance in each downsampling worker process - see _init_ds_worker()
+_DS_WORKER_BR = None
+
+# per-voxel peak memory of one downsampling worker, beyond the raw pixels - 
+ # the float32 filter output plus the float32 copy transformix moves
+_DS_WORKER_FLOAT_BYTES = 8
+
+
+def _available_memory():
+    # bytes of memory available to new processes - None if it cannot be read
+    try:
+        with open('/proc/meminfo') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024 # kB
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _ds_worker_bytes(path):
+    # peak memory estimate to downsample the image at path - header read only
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(str(path))
+    reader.SetImageIO( _image_io_for(path) )
+    reader.ReadImageInformation()
+    voxels = int(np.prod(reader.GetSize(), dtype=np.int64))
+    pixel_bytes = ( sitk.Image([1]*reader.GetDimension(), reader.GetPixelID()
+                        ).GetSizeOfPixelComponent() * reader.GetNumberOfComponents() )
+    return voxels * (pixel_bytes + _DS_WORKER_FLOAT_BYTES)
+
+
+def _configure_sitk_threads(threads = None):
+    # set the ITK threader & thread count ONCE per process - every sitk filter
+     # uses the global defaults.  BRAINREGISTER_THREADS caps the thread count
+     # (eg. on shared nodes), otherwise ITK keeps its own hardware count
+     # an explicit threads always applies - eg. to split cores between workers
+    global _SITK_THREADS
+    if threads is None:
+        if _SITK_THREADS is not None:
+            return
+        threads = ( int(os.environ.get('BRAINREGISTER_THREADS', 0)) or 
+                    sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() )
+    sitk.ProcessObject.SetGlobalDefaultThreader('POOL') # reuse threads across filters
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(threads)
+    _SITK_THREADS = threads
+
+
+def _init_ds_worker(yaml_path, threads):
+    # each worker builds its OWN BrainRegister - sitk objects cannot be pickled
+     # split the cores between the workers, so ITK does not oversubscribe them
+    global _DS_WORKER_BR
+    _configure_sitk_threads(threads)
+    with contextlib.redirect_stdout(io.StringIO()): # discard initialisation output
+        _DS_WORKER_BR = BrainRegister(yaml_path)
+
+
+def _process_image_ds_worker(index):
+    _DS_WORKER_BR.process_image_ds(index)
+    _DS_WORKER_BR.wait_image_write()
+
 
 # example function for testing
 def version():
@@ -29,10 +283,45 @@ def version():
     print("  Author : "+__author__)
 
 
+def _read_yaml_template(template_path):
+    '''Read YAML Template
+    
+    Reads the yaml file at template_path ONCE, returning both the parsed
+    dict and the raw lines (which contain the comments).  The parse is cached
+    against the file modification time, so repeated calls in the same process
+    skip the yaml parsing entirely.
+    
+    Parameters
+    ----------
+    template_path : str or Path
+        Path to the yaml template file.
+    
+    Returns
+    -------
+    params : dict
+        COPY of the parsed yaml dict - safe for the caller to modify.
+    
+    lines : list
+        COPY of the yaml file lines, including line endings.
+    
+    '''
+    key = (str(template_path), os.stat(template_path).st_mtime_ns)
+    
+    if key not in _TEMPLATE_CACHE:
+        with open(template_path, 'rb') as file:
+            raw = file.read()
+        _TEMPLATE_CACHE[key] = ( yaml.load(raw, Loader=SafeLoader), 
+                                 raw.decode().splitlines(keepends=True) )
+    
+    params, lines = _TEMPLATE_CACHE[key]
+    return copy.deepcopy(params), list(lines)
+
+
 def create_parameters_file(sample_template_path, 
             output_dir = Path('brainregister'),
             brainregister_params_template_path = 'brainregister_params', 
-            brainregister_params_filename = 'brainregister_parameters.yaml'):
+            brainregister_params_filename = 'brainregister_parameters.yaml',
+            preserve_comments = True):
     '''Create Brainregister Parameters File
 
     Generates a new brainregister_parameters.yaml file based on the
@@ -79,6 +368,12 @@ def create_parameters_file(sample_template_path,
         will be written to.  Set to 'brainregister_parameters.yaml' by default 
         - RECOMMENDED TO KEEP THIS NAMING CONVENTION!
     
+    preserve_comments : bool
+        Whether to re-insert the comments from the built-in brainregister 
+        parameters template into the written yaml file.  Set to True by 
+        default.  Set to False to skip this step, eg. when generating many 
+        parameters files programmatically.
+    
     Returns
     -------
     brp : dict
@@ -94,19 +389,26 @@ def create_parameters_file(sample_template_path,
     print('')
     
     
-    # RESOLVE the path- remove any .. references and convert to absolute path
-    sample_template_path_res = sample_template_path.resolve()
+    # RESOLVE the paths ONCE - remove ~ and any .. references
+     # resolve() returns an absolute path, so no need for absolute()
+    sample_template_path_res = sample_template_path.expanduser().resolve()
+    output_dir_res = output_dir.expanduser().resolve()
     
-    # Make the path into an absolute path - remove ~ and ensure absolute
-    # AND convert to STRING
-    stp = str(sample_template_path.expanduser().absolute() )
+    # convert to STRING
+    stp = str(sample_template_path_res)
     
     print('  reading source template image information..')
     print('')
-    # try to read image header with sitk
+    # cheap check first - no need to start the sitk reader for a missing file
+    if sample_template_path_res.is_file() == False:
+        print('\033[1;31m ERROR : The input file does not exist: '
+                + stp + ' \033[0;0m')
+        sys.exit('input file not valid')
+    
+    # try to read image header with sitk - spacing & size are needed below
+     # private (DICOM) tags are not used, so do not load them
     reader = sitk.ImageFileReader()
     reader.SetFileName( stp )
-    reader.LoadPrivateTagsOn()
     try:
         reader.ReadImageInformation()
     except:
@@ -115,16 +417,15 @@ def create_parameters_file(sample_template_path,
         sys.exit('input file not valid')
     
     # if image is valid to sitk.reader this will pass
+    spacing = reader.GetSpacing()
+    size = reader.GetSize()
     
     print('  creating brainregister output directory : ' + str(output_dir) )
     print('')
     # next - resolve and create output_dir
-    output_dir.resolve().mkdir(parents=True, exist_ok=True)
+    output_dir_res.mkdir(parents=True, exist_ok=True)
     # this is where the brainregister_parameters.yaml file will be written
-    brainregister_params_path = Path( 
-        str(output_dir.resolve().expanduser().absolute() ) 
-        + os.path.sep
-        + brainregister_params_filename)
+    brainregister_params_path = output_dir_res / brainregister_params_filename
     
     print('  building brainregister parameters file..')
     # next - build the yaml file
@@ -134,15 +435,10 @@ def create_parameters_file(sample_template_path,
         br_params = os.path.join(
                         BRAINREGISTER_MODULE_DIR, 
                         'resources', 'brainregister_parameters.yaml')
-        with open(br_params, 'r') as file:
-            brp = yaml.safe_load(file)
-        
-        # read yaml to list - THIS CONTAINS THE COMMENTS
-        with open(br_params, 'r') as file:
-            brpf = file.readlines()
+        # and read yaml to list - THIS CONTAINS THE COMMENTS
+        brp, brpf = _read_yaml_template(br_params)
     else:
-        with open(brainregister_params_template_path, 'r') as file:
-            brp = yaml.safe_load(file)
+        brp, brpf = _read_yaml_template(brainregister_params_template_path)
     
     brp_keys = list(brp.keys())
     
@@ -153,23 +449,22 @@ def create_parameters_file(sample_template_path,
                   sample_template_path_res.suffix )
     # set sample-template-path to stp
     brp['source-template-path'] = os.path.relpath(
-                sample_template_path_res, 
-                output_dir.resolve().expanduser().absolute()  )
+                sample_template_path_res, output_dir_res )
     
     brp['source-annotations-path'] = [] # set to blank, user can modify manually as needed
     brp['source-structure-tree'] = [] # set to blank, user can modify manually as needed
     
     print('    adding image paths..')
     # get other files with same suffix as stp in parent dir
+    # single scandir pass - DirEntry name and type come from the dir read
     fn, ext = os.path.splitext(sample_template_path_res.name)
-    files = glob.glob( 
-        str( str(sample_template_path_res.parent.expanduser().absolute() ) 
-            + os.path.sep 
-            + "*" 
-            + ext) )
-    # filter to remove the current sample_template_path and extract just the name(s)
-    filenames = [Path(f).name for f in files if f != str(
-                    sample_template_path_res.expanduser().absolute()) ]
+    with os.scandir(sample_template_path_res.parent) as it:
+        # filter to remove the current sample_template_path (and hidden files)
+        filenames = [e.name for e in it if (
+                            e.name.endswith(ext)
+                        and e.name != sample_template_path_res.name
+                        and not e.name.startswith('.')
+                        and e.is_file() ) ]
     
     source_path_keys = [b for b in brp_keys if (
                                 b.startswith('source-') 
@@ -183,78 +478,90 @@ def create_parameters_file(sample_template_path,
     
     print('    adding source template image resolution..')
     
-    if any([r == 1.0 for r in reader.GetSpacing()]):
+    if any([r == 1.0 for r in spacing]):
         print('')
         print('\033[1;31m TEMPLATE RESOLUTION NOT FOUND : '+
               'Please add manually to the brainregister params file! \033[0;0m')
         print('')
     else:
-        print('      adding x-um : ' + str(reader.GetSpacing()[0]) )
-        brp['source-template-resolution']['x-um'] = reader.GetSpacing()[0]
-        print('      adding y-um : ' + str(reader.GetSpacing()[1]) )
-        brp['source-template-resolution']['y-um'] = reader.GetSpacing()[1]
-        print('      adding z-um : ' + str(reader.GetSpacing()[2]) )
-        brp['source-template-resolution']['z-um'] = reader.GetSpacing()[2]
+        print('      adding x-um : ' + str(spacing[0]) )
+        brp['source-template-resolution']['x-um'] = spacing[0]
+        print('      adding y-um : ' + str(spacing[1]) )
+        brp['source-template-resolution']['y-um'] = spacing[1]
+        print('      adding z-um : ' + str(spacing[2]) )
+        brp['source-template-resolution']['z-um'] = spacing[2]
     
     
     print('    adding source template image size..')
     
-    print('      adding x-um : ' + str(reader.GetSize()[0]) )
-    brp['source-template-size']['x'] = reader.GetSize()[0]
-    print('      adding y-um : ' + str(reader.GetSize()[1]) )
-    brp['source-template-size']['y'] = reader.GetSize()[1]
-    print('      adding z-um : ' + str(reader.GetSize()[2]) )
-    brp['source-template-size']['z'] = reader.GetSize()[2]
+    print('      adding x-um : ' + str(size[0]) )
+    brp['source-template-size']['x'] = size[0]
+    print('      adding y-um : ' + str(size[1]) )
+    brp['source-template-size']['y'] = size[1]
+    print('      adding z-um : ' + str(size[2]) )
+    brp['source-template-size']['z'] = size[2]
     
     
     print('    saving brainregister parameters file..')
     with open(brainregister_params_path, 'w') as file:
-        yaml.dump(brp, file, sort_keys=False)
+        yaml.dump(brp, file, Dumper=SafeDumper, sort_keys=False)
     
     # ONLY IF USING brainregister parameters yaml (as know where comments are!)
-    if brainregister_params_template_path == 'brainregister_params':
+    if ( preserve_comments and 
+         brainregister_params_template_path == 'brainregister_params' ):
         # add COMMENTS from original file
         with open(brainregister_params_path, 'r') as file:
             brpf2 = file.readlines()
         
-        # get index of sample-template-orientation 
-         # as sample-images length can VARY!
-        sil = [i for i, s in enumerate(brpf2) if 'source-template-orientation' in s]
-        
-        # get index of downsampled-to-ccf-save-images
-         # as downsampled-to-ccf-parameters-files length can VARY!
-        pfld = [i for i, s in enumerate(brpf2) if 'source-to-target-save-image-type' in s]
-        
-        # get index of ccf-to-downsampled-save-annotation
-         # as ccf-to-downsampled-parameters-files length can VARY!
-        pflc = [i for i, s in enumerate(brpf2) if 'target-to-source-save-image-type' in s]
+        # get index of source-template-orientation 
+         # as source-images length can VARY!
+        # get index of source-to-target-save-image-type
+         # as source-to-target-parameter-files length can VARY!
+        # get index of target-to-source-save-image-type
+         # as target-to-source-parameter-files length can VARY!
+        # all found in ONE pass over the file lines, exit once all are found
+         # keys are top-level so always start the line - use startswith
+        sil = pfld = pflc = None
+        for i, s in enumerate(brpf2):
+            if sil is None and s.startswith('source-template-orientation'):
+                sil = [i]
+            elif pfld is None and s.startswith('source-to-target-save-image-type'):
+                pfld = [i]
+            elif pflc is None and s.startswith('target-to-source-save-image-type'):
+                pflc = [i]
+            
+            if sil and pfld and pflc:
+                break
         
         # concat comments and yaml lines into one list:
-        brpf3 = [ brpf[0:53] + # source- image space comments
-                  brpf2[ 0:(sil[0]+1) ] + # source- params
-                  brpf[71:87] + # target- image space comments
-                  brpf2[ (sil[0]+1):(sil[0]+3)] + # target- params
-                  brpf[89:117] + # downsampling- general comments
-                  brpf2[ (sil[0]+3):(sil[0]+6)] + # downsampling- general params
-                  brpf[120:146] + # downsampling- output comments
-                  brpf2[ (sil[0]+6):(sil[0]+11)] + # source-to-target downsampling output params
-                  brpf[151:152] + # blank line!
-                  brpf2[ (sil[0]+11):(sil[0]+16)] + # target-to-source downsampling output params
-                  brpf[157:206] + # source-to-target comments
-                  brpf2[(sil[0]+16):(pfld[0]+1)] + # source-to-target params
-                  brpf[219:268] + # target-to-source comments
+        brpf3 = list( itertools.chain( 
+                  brpf[0:53], # source- image space comments
+                  brpf2[ 0:(sil[0]+1) ], # source- params
+                  brpf[71:87], # target- image space comments
+                  brpf2[ (sil[0]+1):(sil[0]+3)], # target- params
+                  brpf[89:117], # downsampling- general comments
+                  brpf2[ (sil[0]+3):(sil[0]+6)], # downsampling- general params
+                  brpf[120:146], # downsampling- output comments
+                  brpf2[ (sil[0]+6):(sil[0]+11)], # source-to-target downsampling output params
+                  brpf[151:152], # blank line!
+                  brpf2[ (sil[0]+11):(sil[0]+16)], # target-to-source downsampling output params
+                  brpf[157:206], # source-to-target comments
+                  brpf2[(sil[0]+16):(pfld[0]+1)], # source-to-target params
+                  brpf[219:268], # target-to-source comments
                   brpf2[ (pfld[0]+1):(pflc[0]+1)] # target-to-source params
-                                                          ]
-        brpf3 = brpf3[0] # remove the nesting of this list
+                                                          ) )
         
         # write this OVER the current yaml
         with open(brainregister_params_path, 'w') as file:
-            for b in brpf3:
-                file.write('%s' % b)
+            file.writelines(brpf3)
         
         print('      written brainregister_parameters.yaml file : ' +
                os.path.relpath(brainregister_params_path, os.getcwd()  ) )
         
+    elif brainregister_params_template_path == 'brainregister_params':
+        print('      written brainregister_parameters.yaml file (no comments) : ' +
+               os.path.relpath(brainregister_params_path, os.getcwd()  ) )
+        
     else:
         print('  written custom brainregister parameters yaml file', brainregister_params_template_path)
     
@@ -269,8 +576,99 @@ def create_parameters_file(sample_template_path,
 class BrainRegister(object):
     
     
+    # fixed set of instance attributes - no per-instance __dict__
+     # lazy parameter map properties store to the underscore attributes
+    __slots__ = (
+        # __init__
+        '_nn_pm_cache', '_range_cache', '_elastix_dir', '_rel_cache',
+        '_image_reader', '_image_prefetch', '_image_writer', '_image_writes',
+        '_image_write_lock', '_displacement_field_pms', '_displacement_field',
+        '_label_cache',
+        # set_brainregister_parameters_filepath
+        'yaml_path',
+        # load_params
+        'brp_dir', 'brp', 'brp_keys',
+        # initialise_brainregister
+        '_pfx_ds', '_ext_ds', '_pfx_src_tar', '_ext_src_tar', '_pfx_tar_src',
+        '_ext_tar_src',
+        # resolve_dirs
+        'src_tar_dir', 'tar_src_dir', 'src_tar_ds', 'src_tar_ds_dir',
+        'tar_src_ds', 'tar_src_ds_dir',
+        # resolve_source_params
+        'source_template_path', 'source_template_path_ds',
+        'source_template_path_target', 'source_anno_path',
+        'source_anno_path_ds', 'source_anno_path_target', 'source_tree_path',
+        'source_tree_path_ds', 'source_tree_path_target', 'source_image_path',
+        'source_image_path_ds', 'source_image_path_target',
+        'source_template_img', 'source_template_img_filt',
+        'source_template_img_ds', 'source_template_img_ds_filt',
+        'source_template_img_target', 'source_template_img_target_filt',
+        'source_anno_img', 'source_anno_img_ds', 'source_anno_img_target',
+        'source_image_img', 'source_image_img_ds', 'source_image_img_target',
+        # resolve_target_params
+        'ccfp', 'ccfp_keys', 'target_string', 'target_template_path',
+        'target_template_path_ds', 'target_template_path_source',
+        'target_anno_path', 'target_anno_path_ds', 'target_anno_path_source',
+        'target_tree_path', 'target_tree_path_ds', 'target_tree_path_source',
+        'target_image_paths', 'target_image_paths_ds',
+        'target_image_paths_source', 'target_template_img',
+        'target_template_img_filt', 'target_template_img_ds',
+        'target_template_img_ds_filt', 'target_template_img_source',
+        'target_anno_img', 'target_anno_img_ds', 'target_anno_img_source',
+        'target_image_imgs', 'target_image_imgs_ds',
+        'target_image_imgs_source',
+        # resolve_params
+        'wd', 'src_tar_ds_pm_path', 'src_tar_pm_paths', 'tar_src_ds_pm_path',
+        'tar_src_pm_paths', 'tar_src_ep', 'src_tar_ep', '_src_tar_ds_pm',
+        '_tar_src_ds_pm', '_src_tar_pm', '_tar_src_pm', '_src_tar_ds_pm_anno',
+        '_src_tar_pm_anno', '_tar_src_ds_pm_anno', '_tar_src_pm_anno', 's2t',
+        't2s', '_s2t_xyz', '_t2s_xyz', '_src_size_xyz', '_tar_size_xyz',
+        'downsampling_img', 'src_tar_prefiltered',
+        'tar_src_prefiltered',
+        # move_image_img_ds
+        'img_ds_filter_pipeline',
+        # register_target_to_source
+        'target_template_img_source_filt',
+        # src_tar_prefiltering
+        'src_tar_filter_pipeline',
+        # tar_src_prefiltering
+        'tar_src_filter_pipeline',
+        )
+    
+    
+    
     def __init__(self, yaml_path):
         
+        # nearest neighbour copies of pm lists - see edit_pms_nearest_neighbour()
+        self._nn_pm_cache = {}
+        
+        # pixel value range of images passed to cast_image() - see get_image_range()
+        self._range_cache = {}
+        
+        # sorted label values of 32/64-bit annotations - see get_image_labels()
+        self._label_cache = {}
+        
+        # elastix output dir of the last registration - see register_image()
+        self._elastix_dir = None
+        
+        _configure_sitk_threads()
+        
+        # relative path strings for log messages - see get_relative_path()
+        self._rel_cache = {}
+        
+        # background image reader - see prefetch_image()
+        self._image_reader = None
+        self._image_prefetch = {} # path : future of each image being read
+        
+        # background image writer - see save_image()
+        self._image_writer = None
+        self._image_writes = {} # path : future of each write in flight or failed
+        self._image_write_lock = threading.Lock()
+        
+        # displacement field of a pm list reused for every image - see reuse_displacement_field()
+        self._displacement_field_pms = None
+        self._displacement_field = None # (transform, output geometry, interpolator, default)
+        
         self.set_brainregister_parameters_filepath(yaml_path)
         self.initialise_brainregister()
         self.create_output_dirs()
@@ -300,6 +698,8 @@ class BrainRegister(object):
         
         self.save_target_params()
         
+        self.wait_image_write()
+        
     
     
     
@@ -316,6 +716,15 @@ class BrainRegister(object):
         print('  loading brainregister parameters file..')
         self.load_params()
         
+        # output filename prefixes & image types - read ONCE from brp
+        p = self.brp
+        self._pfx_ds = p['downsampling-prefix']
+        self._ext_ds = p['downsampling-save-image-type']
+        self._pfx_src_tar = p['source-to-target-prefix']
+        self._ext_src_tar = p['source-to-target-save-image-type']
+        self._pfx_tar_src = p['target-to-source-prefix']
+        self._ext_tar_src = p['target-to-source-save-image-type']
+        
         
         ### RESOLVE PARAMETERS ###
         ##########################
@@ -363,21 +772,19 @@ class BrainRegister(object):
             print('')
             sys.exit('  no brainregister_params file!')
         
-        with open(self.yaml_path, 'r') as file:
-            self.brp = yaml.safe_load(file)
+        # C loader where pyyaml has libyaml - the yaml is small, a full load is cheap
+        with open(self.yaml_path, 'rb') as file:
+            self.brp = yaml.load(file, Loader=SafeLoader)
         
         self.brp_keys = list(self.brp.keys())
         # check the resolutions have been set to something other than 0.0 (which is the default)
-        if ( (self.brp['source-template-resolution']['x-um'] == 0.0) | 
-            (self.brp['source-template-resolution']['y-um'] == 0.0) | 
-            (self.brp['source-template-resolution']['z-um'] == 0.0) ) :
+        res = self.brp['source-template-resolution']
+        if not (res['x-um'] and res['y-um'] and res['z-um']): # short-circuits on first 0.0
             print('')
-            print('\033[1;31m ERROR : ' + 
-                  ' image resolution not set in brainregister_params : ' + 
-                      self.yaml_path + ' \033[0;0m')
+            print(f'\033[1;31m ERROR :  image resolution not set in '
+                  f'brainregister_params : {self.yaml_path} \033[0;0m')
             print('')
-            sys.exit( str('ERROR :  image resolution not set in brainregister_params : ' + 
-                      self.yaml_path) )
+            sys.exit(f'ERROR :  image resolution not set in brainregister_params : {self.yaml_path}')
         
         
     
@@ -392,31 +799,25 @@ class BrainRegister(object):
 
         '''
         
-        self.src_tar_dir = Path( str(self.brp_dir) 
-                       + os.path.sep
-                       + self.brp['source-to-target-output'] )
+        self.src_tar_dir = self.brp_dir / self.brp['source-to-target-output']
         
-        self.tar_src_dir = Path( str(self.brp_dir) 
-                       + os.path.sep
-                       + self.brp['target-to-source-output'] )
+        self.tar_src_dir = self.brp_dir / self.brp['target-to-source-output']
         
         # get downsampling output
         self.src_tar_ds = (self.brp['source-to-target-downsampling-output'] is not False)
         
         self.src_tar_ds_dir = None
         if self.src_tar_ds is True:
-            self.src_tar_ds_dir = Path( str(self.brp_dir) 
-                       + os.path.sep
-                       + self.brp['source-to-target-downsampling-output'] )
+            self.src_tar_ds_dir = ( self.brp_dir / 
+                       self.brp['source-to-target-downsampling-output'] )
         
         
         self.tar_src_ds = (self.brp['target-to-source-downsampling-output'] is not False)
         
         self.tar_src_ds_dir = None
         if self.tar_src_ds is True:
-            self.tar_src_ds_dir = Path( str(self.brp_dir) 
-                       + os.path.sep
-                       + self.brp['target-to-source-downsampling-output'] )
+            self.tar_src_ds_dir = ( self.brp_dir / 
+                       self.brp['target-to-source-downsampling-output'] )
         
         
     
@@ -434,31 +835,18 @@ class BrainRegister(object):
 
         '''
         
-        self.source_template_path = Path( 
-            str(self.brp_dir) + 
-            os.path.sep + 
-            self.brp['source-template-path'] ).resolve()
+        self.source_template_path = ( 
+            self.brp_dir / self.brp['source-template-path'] ).resolve()
+        
+        stem = PurePath(self.brp['source-template-path']).stem
         
         self.source_template_path_ds = None
         if self.src_tar_ds is True:
-            self.source_template_path_ds = Path( 
-                str(self.src_tar_ds_dir) + 
-                os.path.sep  + 
-                self.brp['downsampling-prefix'] + 
-                Path(os.path.basename(
-                            self.brp['source-template-path'])).stem + 
-                '.' + 
-                self.brp['downsampling-save-image-type'] )
-        
-        
-        self.source_template_path_target = Path( 
-            str(self.src_tar_dir) + 
-            os.path.sep  + 
-            self.brp['source-to-target-prefix'] + 
-            Path(os.path.basename(
-                            self.brp['source-template-path'])).stem +
-            '.' + 
-            self.brp['source-to-target-save-image-type'] )
+            self.source_template_path_ds = ( 
+                self.src_tar_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
+        
+        self.source_template_path_target = ( 
+            self.src_tar_dir / f'{self._pfx_src_tar}{stem}.{self._ext_src_tar}' )
         
         
         source_path_keys = [b for b in self.brp_keys if (
@@ -476,26 +864,17 @@ class BrainRegister(object):
             
             for sap in self.brp['source-annotations-path']:
                 
-                self.source_anno_path.append(  Path( 
-                    str(self.brp_dir) + 
-                    os.path.sep + sap ).resolve() )
+                stem = PurePath(sap).stem
+                
+                self.source_anno_path.append( 
+                    (self.brp_dir / sap).resolve() )
                 
                 if self.src_tar_ds is True:
-                    self.source_anno_path_ds.append( Path( 
-                        str(self.src_tar_ds_dir) + 
-                        os.path.sep  + 
-                        self.brp['downsampling-prefix'] + 
-                        Path(os.path.basename(sap)).stem + 
-                        '.' + 
-                        self.brp['downsampling-save-image-type'] ) )
-                    
-                self.source_anno_path_target.append( Path( 
-                    str(self.src_tar_dir) + 
-                    os.path.sep  + 
-                    self.brp['source-to-target-prefix'] + 
-                    Path(os.path.basename(sap)).stem +
-                    '.' + 
-                    self.brp['source-to-target-save-image-type'] ) )
+                    self.source_anno_path_ds.append( 
+                        self.src_tar_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
+                    
+                self.source_anno_path_target.append( 
+                    self.src_tar_dir / f'{self._pfx_src_tar}{stem}.{self._ext_src_tar}' )
         
         
         # and structure trees!
@@ -507,20 +886,15 @@ class BrainRegister(object):
             
             for sst in self.brp['source-structure-tree']:
                 
-                self.source_tree_path.append(  Path( 
-                    str(self.brp_dir) + 
-                    os.path.sep + sst ).resolve() )
+                self.source_tree_path.append( 
+                    (self.brp_dir / sst).resolve() )
                 
                 if self.src_tar_ds is True:
-                    self.source_tree_path_ds.append( Path( 
-                        str(self.src_tar_ds_dir) + 
-                        os.path.sep  + 
-                        self.brp['downsampling-prefix'] + sst ) )
+                    self.source_tree_path_ds.append( 
+                        self.src_tar_ds_dir / f'{self._pfx_ds}{sst}' )
                     
-                self.source_tree_path_target.append( Path( 
-                    str(self.src_tar_dir) + 
-                    os.path.sep  + 
-                    self.brp['source-to-target-prefix'] + sst ) )
+                self.source_tree_path_target.append( 
+                    self.src_tar_dir / f'{self._pfx_src_tar}{sst}' )
         
         
         
@@ -531,42 +905,26 @@ class BrainRegister(object):
                             and not b.startswith('source-template-path')
                             and not b.startswith('source-annotations-path') ) ]
         
+        # single pass over all source images - building all three path lists
+        template_dir = self.source_template_path.parent
         self.source_image_path = []
+        self.source_image_path_ds = []
+        self.source_image_path_target = []
         for s in source_path_keys:
             if self.brp[s]: # only add if not blank
-            
-                self.source_image_path.append(
-                    [Path( 
-                str(self.source_template_path.parent) 
-                + os.path.sep 
-                + str(sr)) for sr in self.brp[s] ]
-                     )
                 
-        
-        self.source_image_path_ds = []
-        self.source_image_path_target = []
-        if self.source_image_path: # only flatten list if not empty!
-            
-            self.source_image_path = [item for sublist in self.source_image_path for item in sublist]
-            
-            for s in self.source_image_path:
-                if self.src_tar_ds is True:
-                    self.source_image_path_ds.append( Path( 
-                        str(self.src_tar_ds_dir) + 
-                        os.path.sep  + 
-                        self.brp['downsampling-prefix'] + 
-                        Path(os.path.basename(s)).stem +
-                        '.' + 
-                        self.brp['downsampling-save-image-type'] ) )
+                for sr in self.brp[s]:
                     
-                
-                self.source_image_path_target.append( Path(
-                    str(self.src_tar_dir) + 
-                    os.path.sep  + 
-                    self.brp['source-to-target-prefix'] + 
-                    Path(os.path.basename(s)).stem +
-                    '.' + 
-                    self.brp['source-to-target-save-image-type'] ) )
+                    stem = PurePath(str(sr)).stem
+                    
+                    self.source_image_path.append( template_dir / str(sr) )
+                    
+                    if self.src_tar_ds is True:
+                        self.source_image_path_ds.append( 
+                            self.src_tar_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
+                    
+                    self.source_image_path_target.append( 
+                        self.src_tar_dir / f'{self._pfx_src_tar}{stem}.{self._ext_src_tar}' )
         
         
         # ALSO set all image instance variables to None
@@ -626,13 +984,13 @@ class BrainRegister(object):
             ccf_params = os.path.join(BRAINREGISTER_MODULE_DIR, 'resources',
                                       'allen-ccf', 'ccf_parameters.yaml')
             with open(ccf_params, 'r') as file:
-                self.ccfp = yaml.safe_load(file)
+                self.ccfp = yaml.load(file, Loader=SafeLoader)
         else: # use user-defined path
             ccf_params = str( Path( os.path.join(
                             self.brp['target-template-path'])
                         ).resolve() )
             with open( ccf_params, 'r') as file:
-                self.ccfp = yaml.safe_load( file )
+                self.ccfp = yaml.load(file, Loader=SafeLoader)
         
         
         self.ccfp_keys = list(self.ccfp.keys())
@@ -647,37 +1005,28 @@ class BrainRegister(object):
                  '"ccf" or "target"!')
         
         
-        self.target_template_path = Path( 
-            os.path.dirname(ccf_params) + 
-            os.path.sep + 
-            self.ccfp[str(self.target_string+'-template-path')] ).resolve()
+        # hoist the params dir out of the path loops
+        ccfp_dir = Path(ccf_params).parent
+        
+        template_key = str(self.target_string+'-template-path')
         
+        self.target_template_path = ( 
+            ccfp_dir / self.ccfp[template_key] ).resolve()
+        
+        stem = PurePath(self.ccfp[template_key]).stem
         
         self.target_template_path_ds = None
         if self.tar_src_ds is True:
-            self.target_template_path_ds = Path( 
-                str(self.tar_src_ds_dir) + 
-                os.path.sep  + 
-                self.brp['downsampling-prefix'] + 
-                Path(os.path.basename(
-                    self.ccfp[str(self.target_string+'-template-path')])).stem + 
-                '.' + 
-                self.brp['downsampling-save-image-type'] )
-        
-        
-        self.target_template_path_source = Path( 
-            str(self.tar_src_dir) + 
-            os.path.sep  + 
-            self.brp['target-to-source-prefix'] + 
-            Path(os.path.basename(
-                self.ccfp[str(self.target_string+'-template-path')])).stem +
-            '.' + 
-            self.brp['target-to-source-save-image-type'] )
+            self.target_template_path_ds = ( 
+                self.tar_src_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
+        
+        self.target_template_path_source = ( 
+            self.tar_src_dir / f'{self._pfx_tar_src}{stem}.{self._ext_tar_src}' )
         
         
         target_path_keys = [b for b in self.ccfp_keys if (
                             b.endswith('-path') 
-                    and not b.startswith(str(self.target_string+'-template-path')) 
+                    and not b.startswith(template_key) 
                                  ) ]
         
         
@@ -690,24 +1039,17 @@ class BrainRegister(object):
             
             for tap in self.ccfp[str(self.target_string+'-annotations-path')]:
                 
-                self.target_anno_path.append(Path( 
-                    os.path.dirname(ccf_params) + 
-                    os.path.sep + tap ).resolve() )
+                stem = PurePath(tap).stem
+                
+                self.target_anno_path.append( 
+                    (ccfp_dir / tap).resolve() )
                 
                 if self.tar_src_ds is True:
-                    self.target_anno_path_ds.append( Path( 
-                        str(self.tar_src_ds_dir) + 
-                        os.path.sep  + 
-                        self.brp['downsampling-prefix'] + 
-                        Path(os.path.basename(tap)).stem + 
-                        '.' + self.brp['downsampling-save-image-type'] ) )
+                    self.target_anno_path_ds.append( 
+                        self.tar_src_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
                 
-                self.target_anno_path_source.append( Path( 
-                    str(self.tar_src_dir) + 
-                    os.path.sep  + 
-                    self.brp['target-to-source-prefix'] + 
-                    Path(os.path.basename(tap)).stem +
-                    '.' + self.brp['target-to-source-save-image-type'] ) )
+                self.target_anno_path_source.append( 
+                    self.tar_src_dir / f'{self._pfx_tar_src}{stem}.{self._ext_tar_src}' )
         
         
         # and structure trees!
@@ -719,66 +1061,45 @@ class BrainRegister(object):
             
             for tap in self.ccfp[str(self.target_string+'-structure-tree')]:
                     
-                    self.target_tree_path.append(Path( 
-                        os.path.dirname(ccf_params) + 
-                        os.path.sep + tap ).resolve() )
+                    self.target_tree_path.append( 
+                        (ccfp_dir / tap).resolve() )
                     
                     if self.tar_src_ds is True:
-                        self.target_tree_path_ds.append( Path( 
-                            str(self.tar_src_ds_dir) + 
-                            os.path.sep  + 
-                            self.brp['downsampling-prefix'] + tap ) )
+                        self.target_tree_path_ds.append( 
+                            self.tar_src_ds_dir / f'{self._pfx_ds}{tap}' )
                     
-                    self.target_tree_path_source.append( Path( 
-                        str(self.tar_src_dir) + 
-                        os.path.sep  + 
-                        self.brp['target-to-source-prefix'] + tap ) )
+                    self.target_tree_path_source.append( 
+                        self.tar_src_dir / f'{self._pfx_tar_src}{tap}' )
         
         
         
         
         target_path_keys = [b for b in self.ccfp_keys if (
                             b.endswith('-path') 
-                    and not b.startswith(str(self.target_string+'-template-path'))
+                    and not b.startswith(template_key)
                     and not b.startswith(str(self.target_string+'-annotations-path')) 
                                   ) ]
         
+        # single pass over all target images - building all three path lists
+        template_dir = self.target_template_path.parent
         self.target_image_paths = []
-        for s in target_path_keys:
-            if self.ccfp[s]: # only add if not blank
-            
-                self.target_image_paths.append(
-                    [Path( 
-                str(self.target_template_path.parent) 
-                + os.path.sep 
-                + str(s)) for s in self.ccfp[s] ]
-                     )
-                
-        
         self.target_image_paths_ds = []
         self.target_image_paths_source = []
-        if self.target_image_paths: # only flatten list if not empty!
-            self.target_image_paths = [item for sublist in self.target_image_paths for item in sublist]
-            
-            for s in self.target_image_paths:
+        for t in target_path_keys:
+            if self.ccfp[t]: # only add if not blank
                 
-                if self.tar_src_ds is True:
+                for tr in self.ccfp[t]:
+                    
+                    stem = PurePath(str(tr)).stem
+                    
+                    self.target_image_paths.append( template_dir / str(tr) )
                     
-                    self.target_image_paths_ds.append( Path( 
-                        str(self.tar_src_ds_dir) + 
-                        os.path.sep  + 
-                        self.brp['downsampling-prefix'] + 
-                        Path(os.path.basename(s)).stem +
-                        '.' + 
-                        self.brp['downsampling-save-image-type'] ) )
-                
-                self.target_image_paths_source.append( Path(
-                    str(self.tar_src_dir) + 
-                    os.path.sep  + 
-                    self.brp['target-to-source-prefix'] + 
-                    Path(os.path.basename(s)).stem +
-                    '.' + 
-                    self.brp['target-to-source-save-image-type'] ) )
+                    if self.tar_src_ds is True:
+                        self.target_image_paths_ds.append( 
+                            self.tar_src_ds_dir / f'{self._pfx_ds}{stem}.{self._ext_ds}' )
+                    
+                    self.target_image_paths_source.append( 
+                        self.tar_src_dir / f'{self._pfx_tar_src}{stem}.{self._ext_tar_src}' )
         
         # ALSO set all image instance variables to None
         self.target_template_img = None
@@ -840,39 +1161,33 @@ class BrainRegister(object):
         
         # source-to-target downsampled transformix params
         if self.src_tar_ds == True: # save to ds_dir
-            self.src_tar_ds_pm_path = [ Path(os.path.join( 
-             self.src_tar_ds_dir, 
-             self.brp['source-to-target-downsampling-transform-parameter-file'] ) ) ]
+            self.src_tar_ds_pm_path = [ self.src_tar_ds_dir /
+             self.brp['source-to-target-downsampling-transform-parameter-file'] ]
             
         else: # save to src to target dir
-            self.src_tar_ds_pm_path = [ Path(os.path.join( 
-             self.src_tar_dir, 
-             self.brp['source-to-target-downsampling-transform-parameter-file'] ) ) ]
+            self.src_tar_ds_pm_path = [ self.src_tar_dir /
+             self.brp['source-to-target-downsampling-transform-parameter-file'] ]
         
         # source-to-target transformix params
         # applied to the source and target AFTER downsampling
         self.src_tar_pm_paths = []
         for pm in self.brp['source-to-target-transform-parameter-files']:
-            self.src_tar_pm_paths.append( 
-                    Path( os.path.join(self.src_tar_dir, pm ) ) )
+            self.src_tar_pm_paths.append( self.src_tar_dir / pm )
         
         # target-to-source downsampled transformix params
         if self.tar_src_ds == True: # save to ds_dir
             # source-to-downsampled
-            self.tar_src_ds_pm_path = [ Path(os.path.join( 
-             self.tar_src_ds_dir, 
-             self.brp['target-to-source-downsampling-transform-parameter-file'] ) ) ]
+            self.tar_src_ds_pm_path = [ self.tar_src_ds_dir /
+             self.brp['target-to-source-downsampling-transform-parameter-file'] ]
         else: # save to target to src dir
-            self.tar_src_ds_pm_path = [ Path(os.path.join( 
-             self.tar_src_dir, 
-             self.brp['target-to-source-downsampling-transform-parameter-file'] ) ) ]
+            self.tar_src_ds_pm_path = [ self.tar_src_dir /
+             self.brp['target-to-source-downsampling-transform-parameter-file'] ]
         
         # target-to-source transformix params
         # applied to the source and target AFTER downsampling
         self.tar_src_pm_paths = []
         for pm in self.brp['target-to-source-transform-parameter-files']:
-            self.tar_src_pm_paths.append( 
-                    Path( os.path.join(self.tar_src_dir, pm ) ) )
+            self.tar_src_pm_paths.append( self.tar_src_dir / pm )
         
         
         # check params-filenames and files are of the same number
@@ -891,33 +1206,36 @@ class BrainRegister(object):
         self.src_tar_ep = self.get_elastix_params(self.brp['source-to-target-elastix-parameter-files'])
         
         
-        # load the parameter map lists if they exist, or set to None
-        self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path) 
-        self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path) 
+        # parameter map lists are LAZY - loaded from file on first access
+         # see the src_tar_ds_pm .. tar_src_pm_anno properties below
+        self._src_tar_ds_pm = None
+        self._tar_src_ds_pm = None
         
-        self.src_tar_pm = self.load_pm_files(self.src_tar_pm_paths)
-        self.tar_src_pm = self.load_pm_files(self.tar_src_pm_paths)
+        self._src_tar_pm = None
+        self._tar_src_pm = None
         
-        # create the nearest neighbour transform for any images labelled as ANNOTATION
+        # the nearest neighbour transform for any images labelled as ANNOTATION
         # eg. source-annotations-path or target-annotation-path
-        self.src_tar_ds_pm_anno = None
-        self.src_tar_pm_anno = None
-        self.tar_src_ds_pm_anno = None
-        self.tar_src_pm_anno = None
-        
-        if self.source_anno_path != []:
-            self.src_tar_ds_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_ds_pm)
-            self.src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
-        
-        if self.target_anno_path != []:
-            self.tar_src_ds_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_ds_pm)
-            self.tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
+        self._src_tar_ds_pm_anno = None
+        self._src_tar_pm_anno = None
+        self._tar_src_ds_pm_anno = None
+        self._tar_src_pm_anno = None
         
         
         # can load the src to tar and tar to src scale factors now
         # to compute the downsampling
         self.s2t, self.t2s = self.get_source_target_scale_factors()
         
+        # and store as XYZ vectors ONCE - along with the template sizes
+         # used to build the scaling parameter maps
+        xyz_res = ('x-um', 'y-um', 'z-um')
+        self._s2t_xyz = np.array([self.s2t[k] for k in xyz_res])
+        self._t2s_xyz = np.array([self.t2s[k] for k in xyz_res])
+        self._src_size_xyz = np.array(
+                [self.brp['source-template-size'][k] for k in ('x', 'y', 'z')] )
+        self._tar_size_xyz = np.array(
+                [self.ccfp[self.target_string+'-template-size'][k] for k in ('x', 'y', 'z')] )
+        
         # and therefore work out which image should undergo downsampling
         # source or target, depending on which has the HIGHER resolution
         s2t_ratio = (self.s2t['x-um']*self.s2t['y-um']*self.s2t['z-um'])
@@ -934,6 +1252,101 @@ class BrainRegister(object):
         # use to determine whether the src->tar or tar->src prefiltering has been applied
         self.src_tar_prefiltered = False
         self.tar_src_prefiltered = False
+
+    
+    
+    # LAZY parameter maps : load the pm files the first time they are accessed
+     # remain None while the pm files do not exist on disk
+    
+    @property
+    def src_tar_ds_pm(self):
+        if self._src_tar_ds_pm is None:
+            self._src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
+        return self._src_tar_ds_pm
+    
+    @src_tar_ds_pm.setter
+    def src_tar_ds_pm(self, pms):
+        self._src_tar_ds_pm = pms
+    
+    
+    @property
+    def tar_src_ds_pm(self):
+        if self._tar_src_ds_pm is None:
+            self._tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
+        return self._tar_src_ds_pm
+    
+    @tar_src_ds_pm.setter
+    def tar_src_ds_pm(self, pms):
+        self._tar_src_ds_pm = pms
+    
+    
+    @property
+    def src_tar_pm(self):
+        if self._src_tar_pm is None:
+            self._src_tar_pm = self.load_pm_files(self.src_tar_pm_paths)
+        return self._src_tar_pm
+    
+    @src_tar_pm.setter
+    def src_tar_pm(self, pms):
+        self._src_tar_pm = pms
+    
+    
+    @property
+    def tar_src_pm(self):
+        if self._tar_src_pm is None:
+            self._tar_src_pm = self.load_pm_files(self.tar_src_pm_paths)
+        return self._tar_src_pm
+    
+    @tar_src_pm.setter
+    def tar_src_pm(self, pms):
+        self._tar_src_pm = pms
+    
+    
+    # annotation pms are only built if there are annotation images to transform
+    
+    @property
+    def src_tar_ds_pm_anno(self):
+        if self._src_tar_ds_pm_anno is None and self.source_anno_path != []:
+            self._src_tar_ds_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_ds_pm)
+        return self._src_tar_ds_pm_anno
+    
+    @src_tar_ds_pm_anno.setter
+    def src_tar_ds_pm_anno(self, pms):
+        self._src_tar_ds_pm_anno = pms
+    
+    
+    @property
+    def src_tar_pm_anno(self):
+        if self._src_tar_pm_anno is None and self.source_anno_path != []:
+            self._src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
+        return self._src_tar_pm_anno
+    
+    @src_tar_pm_anno.setter
+    def src_tar_pm_anno(self, pms):
+        self._src_tar_pm_anno = pms
+    
+    
+    @property
+    def tar_src_ds_pm_anno(self):
+        if self._tar_src_ds_pm_anno is None and self.target_anno_path != []:
+            self._tar_src_ds_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_ds_pm)
+        return self._tar_src_ds_pm_anno
+    
+    @tar_src_ds_pm_anno.setter
+    def tar_src_ds_pm_anno(self, pms):
+        self._tar_src_ds_pm_anno = pms
+    
+    
+    @property
+    def tar_src_pm_anno(self):
+        if self._tar_src_pm_anno is None and self.target_anno_path != []:
+            self._tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
+        return self._tar_src_pm_anno
+    
+    @tar_src_pm_anno.setter
+    def tar_src_pm_anno(self, pms):
+        self._tar_src_pm_anno = pms
+    
     
     
     
@@ -953,31 +1366,29 @@ class BrainRegister(object):
         
         print('  create output dirs..')
         
-                
+        # mkdir(exist_ok=True) is a no-op for an existing dir - no separate 
+         # existence check (a scandir of brp_dir only sees its direct children, 
+         # so nested output dir settings would be missed)
         if self.src_tar_ds is True:
             print('    making source-to-target downsampling dir : '+ 
                       self.get_relative_path(self.src_tar_ds_dir) )
-            if self.src_tar_ds_dir.exists() == False:
-                self.src_tar_ds_dir.mkdir(parents = True, exist_ok=True)
+            self.src_tar_ds_dir.mkdir(parents = True, exist_ok=True)
             
         
         if self.tar_src_ds is True:
             print('    making source-to-target downsampling dir : '+ 
                       self.get_relative_path(self.tar_src_ds_dir) )
-            if self.tar_src_ds_dir.exists() == False:
-                self.tar_src_ds_dir.mkdir(parents = True, exist_ok=True)
+            self.tar_src_ds_dir.mkdir(parents = True, exist_ok=True)
             
         
         
         print('    making source-to-target dir  : '+ 
               self.get_relative_path(self.src_tar_dir) )
-        if self.src_tar_dir.exists() == False:
-            self.src_tar_dir.mkdir(parents = True, exist_ok=True)
+        self.src_tar_dir.mkdir(parents = True, exist_ok=True)
         
         print('    making target-to-source dir : '+ 
               self.get_relative_path(self.tar_src_dir) )
-        if self.tar_src_dir.exists() == False:
-            self.tar_src_dir.mkdir(parents = True, exist_ok=True)
+        self.tar_src_dir.mkdir(parents = True, exist_ok=True)
         
         print('')
         
@@ -999,13 +1410,8 @@ class BrainRegister(object):
                         BRAINREGISTER_MODULE_DIR, 
                         'resources', 'target_parameters.yaml')
         
-        # read yaml to dict
-        with open(tar_params_path, 'r') as file:
-            tp = yaml.safe_load(file)
-        
-        # read yaml to list - THIS CONTAINS THE COMMENTS
-        with open(tar_params_path, 'r') as file:
-            tpf = file.readlines()
+        # read yaml to dict, and to list - THIS CONTAINS THE COMMENTS
+        tp, tpf = _read_yaml_template(tar_params_path)
         
         # write variables to param list
         tp['target-template-path'] = self.brp['source-template-path']
@@ -1046,7 +1452,7 @@ class BrainRegister(object):
         # write param list to brainregister output DIR
         print('    saving target parameters file..')
         with open(target_params_output_path, 'w') as file:
-            yaml.dump(tp, file, sort_keys=False)
+            yaml.dump(tp, file, Dumper=SafeDumper, sort_keys=False)
         
         # add COMMENTS from original file
         with open(target_params_output_path, 'r') as file:
@@ -1054,21 +1460,20 @@ class BrainRegister(object):
         
         # get index of sample-template-orientation 
          # as sample-images length can VARY!
-        til = [i for i, s in enumerate(tpf2) if 'target-template-resolution' in s]
+        til = [i for i, s in enumerate(tpf2) if s.startswith('target-template-resolution')]
         
         
         # concat comments and yaml lines into one list:
-        tpf3 = [ tpf[0:24] + # target paths
-                  tpf2[ 0:(til[0]) ] + # source- params
-                  tpf[29:44] + # target params
+        tpf3 = list( itertools.chain( 
+                  tpf[0:24], # target paths
+                  tpf2[ 0:(til[0]) ], # source- params
+                  tpf[29:44], # target params
                   tpf2[ (til[0]):(til[0]+10)] # target- params
-                                                          ]
-        tpf3 = tpf3[0] # remove the nesting of this list
+                                                          ) )
         
         # write this OVER the current yaml
         with open(target_params_output_path, 'w') as file:
-            for t in tpf3:
-                file.write('%s' % t)
+            file.writelines(tpf3)
         
         print('      written target_parameters.yaml file : ' +
                os.path.relpath(target_params_output_path, os.getcwd()  ) )
@@ -1092,8 +1497,14 @@ class BrainRegister(object):
             The relative path as a string.
 
         """
-        path = path.resolve()
-        return os.path.relpath(path, start=self.wd)
+        rel = self._rel_cache.get(path)
+        if rel is None: # first time this path is logged - compute & keep the string
+            p = Path(path)
+            if not p.is_absolute(): # resolve only relative paths - avoids a syscall
+                p = p.resolve()
+            rel = os.path.relpath(str(p), start=str(self.wd))
+            self._rel_cache[path] = rel
+        return rel
         
     
     
@@ -1194,7 +1605,7 @@ class BrainRegister(object):
         if (self.downsampling_img == 'source'):
             # save the source -> target downsampling template - if requested in params file!
             if self.brp['source-to-target-downsampling-save-template'] == True:
-                if self.source_template_img_ds != None:
+                if self.source_template_img_ds is not None:
                     print('  saving source downsampled template image : ' +
                       self.get_relative_path(self.source_template_path_ds ) )
                     self.save_image(self.source_template_img_ds, 
@@ -1206,7 +1617,7 @@ class BrainRegister(object):
         elif (self.downsampling_img == 'target'):
             # save the target -> source downsampling template - if requested in params file!
             if self.brp['target-to-source-downsampling-save-template'] == True:
-                if self.template_ds_img != None:
+                if self.template_ds_img is not None:
                     print('  saving target downsampled template image : ' +
                       self.get_relative_path(self.target_template_path_ds ) )
                     self.save_image(self.target_template_img_ds, self.target_template_path_ds)
@@ -1248,17 +1659,16 @@ class BrainRegister(object):
             if self.brp['downsampling-filter'] != 'false':
                 print('    running downsampling filter..')
                 self.img_ds_filter_pipeline = self.compute_adaptive_filter_img_ds()
-                img_filt = self.apply_adaptive_filter(
+                img = self.apply_adaptive_filter(
                                     img, self.img_ds_filter_pipeline)
-            else:
-                img_filt = img
+                # raw image now unreferenced - freed before transformix runs
             
             # to move FROM SOURCE TO DS, need the src -> tar ds pm files
-            if self.src_tar_ds_pm == None:
+            if self.src_tar_ds_pm is None:
                 print('  loading source-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.src_tar_ds_pm_path[0] ) )
                 self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
-                if self.src_tar_ds_pm == None:
+                if self.src_tar_ds_pm is None:
                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
             
             # transform all input images with transformix
@@ -1269,7 +1679,7 @@ class BrainRegister(object):
             print('========================================================================')
             print('')
             print('')
-            img_t = self.transform_image(img_filt, self.src_tar_ds_pm)
+            img_t = self.transform_image(img, self.src_tar_ds_pm)
             return img_t
             
             
@@ -1280,17 +1690,16 @@ class BrainRegister(object):
             if self.brp['downsampling-filter'] != 'false':
                 print('    running downsampling filter..')
                 self.img_ds_filter_pipeline = self.compute_adaptive_filter_img_ds()
-                img_filt = self.apply_adaptive_filter(
+                img = self.apply_adaptive_filter(
                                     img, self.img_ds_filter_pipeline)
-            else:
-                img_filt = img
+                # raw image now unreferenced - freed before transformix runs
             
             # to move FROM TARGET TO DS, need the tar -> src ds pm files
-            if self.tar_src_ds_pm == None:
+            if self.tar_src_ds_pm is None:
                 print('  loading target-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.tar_src_ds_pm_path[0] ) )
                 self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
-                if self.tar_src_ds_pm == None:
+                if self.tar_src_ds_pm is None:
                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
             
             # transform all input images with transformix
@@ -1301,7 +1710,7 @@ class BrainRegister(object):
             print('========================================================================')
             print('')
             print('')
-            img_t = self.transform_image(img_filt, self.tar_src_ds_pm)
+            img_t = self.transform_image(img, self.tar_src_ds_pm)
             return img_t
             
             
@@ -1348,11 +1757,11 @@ class BrainRegister(object):
             #    img_filt = img
             
             # to move FROM SOURCE TO DS, need the src -> tar ds pm files
-            if self.src_tar_ds_pm_anno == None:
+            if self.src_tar_ds_pm_anno is None:
                 print('  loading source-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.src_tar_ds_pm_path[0] ) )
                 self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
-                if self.src_tar_ds_pm == None:
+                if self.src_tar_ds_pm is None:
                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                 self.src_tar_ds_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_ds_pm)
             
@@ -1381,11 +1790,11 @@ class BrainRegister(object):
             #    img_filt = img
             
             # to move FROM TARGET TO DS, need the tar -> src ds pm files
-            if self.tar_src_ds_pm_anno == None:
+            if self.tar_src_ds_pm_anno is None:
                 print('  loading target-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.tar_src_ds_pm_path[0] ) )
                 self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
-                if self.tar_src_ds_pm == None:
+                if self.tar_src_ds_pm is None:
                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                 self.tar_src_ds_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_ds_pm)
             
@@ -1431,11 +1840,11 @@ class BrainRegister(object):
             # ds -> img is ds to source image space
             
             # to move FROM DS TO SOURCE, need the tar -> src ds pm files
-            if self.tar_src_ds_pm == None:
+            if self.tar_src_ds_pm is None:
                 print('  loading downsampled-to-source transform parameters file : ' +
                       self.get_relative_path(self.tar_src_ds_pm_path[0] ) )
                 self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
-                if self.tar_src_ds_pm == None:
+                if self.tar_src_ds_pm is None:
                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
             
             # transform all input images with transformix
@@ -1454,11 +1863,11 @@ class BrainRegister(object):
             # ds -> ims is ds to target image space
             
             # to move FROM DS TO TARGET, need the src -> tar ds pm files
-            if self.src_tar_ds_pm == None:
+            if self.src_tar_ds_pm is None:
                 print('  loading downsampled-to-target transform parameters file : ' +
                       self.get_relative_path(self.src_tar_ds_pm_path[0] ) )
                 self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
-                if self.src_tar_ds_pm == None:
+                if self.src_tar_ds_pm is None:
                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
             
             # transform all input images with transformix
@@ -1504,11 +1913,11 @@ class BrainRegister(object):
             # ds -> img is ds to source image space
             
             # to move FROM DS TO SOURCE, need the tar -> src ds pm files
-            if self.tar_src_ds_pm_anno == None:
+            if self.tar_src_ds_pm_anno is None:
                 print('  loading target-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.tar_src_ds_pm_path[0] ) )
                 self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
-                if self.tar_src_ds_pm == None:
+                if self.tar_src_ds_pm is None:
                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                 self.tar_src_ds_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_ds_pm)
             
@@ -1528,11 +1937,11 @@ class BrainRegister(object):
             # ds -> ims is ds to target image space
             
             # to move FROM DS TO TARGET, need the src -> tar ds pm files
-            if self.src_tar_ds_pm_anno == None:
+            if self.src_tar_ds_pm_anno is None:
                 print('  loading source-to-downsampled transform parameters file : ' +
                       self.get_relative_path(self.src_tar_ds_pm_path[0] ) )
                 self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
-                if self.src_tar_ds_pm == None:
+                if self.src_tar_ds_pm is None:
                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                 self.src_tar_ds_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_ds_pm)
             
@@ -1562,20 +1971,20 @@ class BrainRegister(object):
             
             if self.source_template_path_ds.exists() == False: # only transform if the output does not exist
                 
-                if self.source_template_img_ds == None: # and if the output image is not already loaded!
+                if self.source_template_img_ds is None: # and if the output image is not already loaded!
                     # TRANSFORM : will transform sample template to ds space
                     
-                    if self.source_template_img == None:
+                    if self.source_template_img is None:
                         print('  loading source template image : ' + 
                           self.get_relative_path(self.source_template_path) )
                         self.source_template_img = self.load_image(self.source_template_path)
                     
                     
-                    if self.src_tar_ds_pm == None:
+                    if self.src_tar_ds_pm is None:
                         print('  loading source-to-downsampled transform parameters file : ' +
                               self.get_relative_path(self.src_tar_ds_pm_path[0] ) )
                         self.src_tar_ds_pm = self.load_pm_files(self.src_tar_ds_pm_path)
-                        if self.src_tar_ds_pm == None:
+                        if self.src_tar_ds_pm is None:
                             print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                     
                     
@@ -1607,6 +2016,9 @@ class BrainRegister(object):
                     return self.source_template_img_ds
             
             else:
+                if self.source_template_img_ds is not None: # already in memory - skip the disk read
+                    print('  downsampled source template image exists - returning image..')
+                    return self.source_template_img_ds
                 print('  downsampled source template image exists - loading image..')
                 self.source_template_img_ds = self.load_image(self.source_template_path_ds)
                 return self.source_template_img_ds
@@ -1617,20 +2029,20 @@ class BrainRegister(object):
             
             if self.target_template_path_ds.exists() == False: # only transform if the output does not exist
                 
-                if self.target_template_img_ds == None: # and if the output image is not already loaded!
+                if self.target_template_img_ds is None: # and if the output image is not already loaded!
                     # TRANSFORM : will transform sample template to ds space
                     
-                    if self.target_template_img == None:
+                    if self.target_template_img is None:
                         print('  loading target template image : ' + 
                           self.get_relative_path(self.target_template_path) )
                         self.target_template_img = self.load_image(self.target_template_path)
                     
                     
-                    if self.tar_src_ds_pm == None:
+                    if self.tar_src_ds_pm is None:
                         print('  loading target-to-downsampled transform parameters file : ' +
                               self.get_relative_path(self.tar_src_ds_pm_path[0] ) )
                         self.tar_src_ds_pm = self.load_pm_files(self.tar_src_ds_pm_path)
-                        if self.tar_src_ds_pm == None:
+                        if self.tar_src_ds_pm is None:
                             print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                     
                     
@@ -1662,6 +2074,9 @@ class BrainRegister(object):
                     return self.target_template_img_ds
             
             else:
+                if self.target_template_img_ds is not None: # already in memory - skip the disk read
+                    print('  downsampled target template image exists - returning image..')
+                    return self.target_template_img_ds
                 print('  downsampled target template image exists - loading image..')
                 self.target_template_img_ds = self.load_image(self.target_template_path_ds)
                 return self.target_template_img_ds
@@ -1786,19 +2201,13 @@ class BrainRegister(object):
         if (self.downsampling_img == 'source'):
             # target-to-source resolution diff. used to compute filter radius
             # Median of res. diff for smoothed downsampling
-            return ImageFilterPipeline(
-                    str("M,"+
-                    str(round( (self.t2s['x-um'] ) / 2)) + ',' +
-                    str(round( (self.t2s['y-um'] ) / 2)) + ',' +
-                    str(round( (self.t2s['z-um'] ) / 2)) ) )
+            return ImageFilterPipeline( "M," + 
+                    ','.join( str(round(f / 2)) for f in self._t2s_xyz.tolist() ) )
         
         if (self.downsampling_img == 'target'):
             # source-to-target resolution diff. used to comptue filter radius
-            return ImageFilterPipeline(
-                str("M,"+
-                str(round( (self.s2t['x-um']) / 2)) + ',' +
-                str(round( (self.s2t['y-um']) / 2)) + ',' +
-                str(round( (self.s2t['z-um']) / 2)) )  )
+            return ImageFilterPipeline( "M," + 
+                    ','.join( str(round(f / 2)) for f in self._s2t_xyz.tolist() ) )
         
     
     
@@ -1811,35 +2220,20 @@ class BrainRegister(object):
         if self.downsampling_img =='source':
             # downsampling the source image : source -> downsampled (target res.)
             
-            img_ds_pm = sitk.ReadParameterFile(
-                        os.path.join(BRAINREGISTER_MODULE_DIR, 'resources',
-                                          'transformix-parameter-files', 
-                                          '00_scaling.txt') )
+            img_ds_pm = _read_parameter_file(_SCALING_PM_PATH)
             # see keys with list(img_ds_pm)
             # see contents of keys with img_ds_pm['key']
             
             # edit TransformParameters to correct tuple
              # use t2s - as the registration is FROM fixed TO moving!!!
-            img_ds_pm['TransformParameters'] = tuple( 
-                [str("{:.6f}".format(self.t2s['x-um'])), 
-                 '0.000000', '0.000000','0.000000', 
-                 str("{:.6f}".format(self.t2s['y-um'])), 
-                 '0.000000','0.000000','0.000000', 
-                 str("{:.6f}".format(self.t2s['z-um'])), 
-                 '0.000000','0.000000','0.000000'] )
+            img_ds_pm['TransformParameters'] = _scaling_parameters(self._t2s_xyz)
             
             # AND edit the Size to correct tuple
              # here want to use s2t - as this defines the size of the final FIXED image!
-            img_ds_pm['Size'] = tuple( 
-                [str("{:.6f}".format( round(
-                     self.brp['source-template-size']['x'] * self.s2t['x-um']) ) ), 
-                 str("{:.6f}".format( round(
-                     self.brp['source-template-size']['y'] * self.s2t['y-um']) ) ),
-                 str("{:.6f}".format( round(
-                     self.brp['source-template-size']['z'] * self.s2t['z-um']))) ] )
+            img_ds_pm['Size'] = _size_parameters(self._src_size_xyz * self._s2t_xyz)
             
             # set the output format
-            img_ds_pm['ResultImageFormat'] = tuple( [ self.brp['downsampling-save-image-type'] ] )
+            img_ds_pm['ResultImageFormat'] = tuple( [ self._ext_ds ] )
             
             img_ds_pm = [img_ds_pm]
             # wrap in list so this works with transform_image like any other set pof parameter maps!
@@ -1850,38 +2244,20 @@ class BrainRegister(object):
         elif self.downsampling_img =='target':
             # downsampling the target image : target -> downsampled (source res.)
             
-            img_ds_pm = sitk.ReadParameterFile(
-                        os.path.join(BRAINREGISTER_MODULE_DIR, 'resources',
-                                          'transformix-parameter-files', 
-                                          '00_scaling.txt') )
+            img_ds_pm = _read_parameter_file(_SCALING_PM_PATH)
             # see keys with list(img_ds_pm)
             # see contents of keys with img_ds_pm['key']
             
             # edit TransformParameters to correct tuple
              # use s2t - as the registration is FROM fixed TO moving!!!
-            img_ds_pm['TransformParameters'] = tuple( 
-                [str("{:.6f}".format(self.s2t['x-um'])), 
-                 '0.000000', '0.000000','0.000000', 
-                 str("{:.6f}".format(self.s2t['y-um'])), 
-                 '0.000000','0.000000','0.000000', 
-                 str("{:.6f}".format(self.s2t['z-um'])), 
-                 '0.000000','0.000000','0.000000'] )
+            img_ds_pm['TransformParameters'] = _scaling_parameters(self._s2t_xyz)
             
             # AND edit the Size to correct tuple
              # here want to use t2s - as this defines the size of the final FIXED image!
-            img_ds_pm['Size'] = tuple( 
-                [str("{:.6f}".format( round(
-                    self.ccfp[str(self.target_string+'-template-size')]['x'] 
-                      * self.t2s['x-um']) ) ), 
-                 str("{:.6f}".format( round(
-                     self.ccfp[str(self.target_string+'-template-size')]['y'] 
-                       * self.t2s['y-um']) ) ),
-                 str("{:.6f}".format( round(
-                     self.ccfp[str(self.target_string+'-template-size')]['z'] 
-                       * self.t2s['z-um']))) ] )
+            img_ds_pm['Size'] = _size_parameters(self._tar_size_xyz * self._t2s_xyz)
             
             # set the output format
-            img_ds_pm['ResultImageFormat'] = tuple( [ self.brp['downsampling-save-image-type'] ] )
+            img_ds_pm['ResultImageFormat'] = tuple( [ self._ext_ds ] )
             
             img_ds_pm = [img_ds_pm]
             # wrap in list so this works with transform_image like any other set pof parameter maps!
@@ -1896,32 +2272,20 @@ class BrainRegister(object):
         
         if self.downsampling_img =='source':
             # downsampling the source image : downsampled (target res.) -> source
-            ds_img_pm = sitk.ReadParameterFile(
-                        os.path.join(BRAINREGISTER_MODULE_DIR, 'resources',
-                                          'transformix-parameter-files', 
-                                          '00_scaling.txt') )
+            ds_img_pm = _read_parameter_file(_SCALING_PM_PATH)
             # see keys with list(ds_img_pm)
             # see contents of keys with ds_img_pm['key']
             
             # edit TransformParameters to correct tuple
              # use s2c - as the registration is FROM fixed TO moving!!!
-            ds_img_pm['TransformParameters'] = tuple( 
-                [str("{:.6f}".format(self.s2t['x-um'])), 
-                 '0.000000', '0.000000','0.000000', 
-                 str("{:.6f}".format(self.s2t['y-um'])), 
-                 '0.000000','0.000000','0.000000', 
-                 str("{:.6f}".format(self.s2t['z-um'])), 
-                 '0.000000','0.000000','0.000000'] )
+            ds_img_pm['TransformParameters'] = _scaling_parameters(self._s2t_xyz)
             
             # AND edit the Size to correct tuple
              # here want to use source template size - as this defines the size of the final FIXED image!
-            ds_img_pm['Size'] = tuple( 
-                [str("{:.6f}".format( round( self.brp['source-template-size']['x'] ))), 
-                 str("{:.6f}".format( round( self.brp['source-template-size']['y'] ))),
-                 str("{:.6f}".format( round( self.brp['source-template-size']['z'] ))) ] )
+            ds_img_pm['Size'] = _size_parameters(self._src_size_xyz)
             
             # set the output format
-            ds_img_pm['ResultImageFormat'] = tuple( [ self.brp['downsampling-save-image-type'] ] )
+            ds_img_pm['ResultImageFormat'] = tuple( [ self._ext_ds ] )
             
             ds_img_pm = [ds_img_pm]
             # wrap in list so this works with transform_image like any other set pof parameter maps!
@@ -1931,25 +2295,104 @@ class BrainRegister(object):
     
     
     
-    def save_image(self, image, path):
+    def save_image(self, image, path, compression_level = _COMPRESSION_LEVEL):
+        
+        # write in a pool of background threads - sitk releases the GIL, so the 
+         # compression of one or more images overlaps with the next transform.
+         # At most _IMAGE_WRITERS writes are in flight, which bounds the memory 
+         # held by images waiting to be written
+         # the lock guards the queue - images may be saved & loaded from threads
+        with self._image_write_lock:
+            if self._image_writer is None:
+                self._image_writer = ThreadPoolExecutor(max_workers=_IMAGE_WRITERS)
+            if str(path) in self._image_writes: # path written again - wait for the first
+                self._image_writes.pop(str(path)).result()
+            # only UNFINISHED writes count - wait for whichever finishes first, 
+             # not the oldest.  Finished writes are dropped, failed ones are kept 
+             # so their error is raised when that path is waited on
+            running = [ f for f in self._image_writes.values() if not f.done() ]
+            while len(running) >= _IMAGE_WRITERS:
+                wait(running, return_when = FIRST_COMPLETED)
+                running = [ f for f in running if not f.done() ]
+            for p in [ p for p, f in self._image_writes.items() 
+                         if f.done() and f.exception() is None ]:
+                del self._image_writes[p]
+            
+            # save with simpleITK - much FASTER even for nrrd images!
+            future = self._image_writer.submit(
+                sitk.WriteImage,
+                image,   # sitk image
+                str(path), # dir plus file name
+                True, # useCompression set to TRUE
+                compression_level # LOW level - gzip level 9 is much slower for little gain
+                )
+            future.add_done_callback( _report_image_write(path) )
+            self._image_writes[str(path)] = future
         
-        # save with simpleITK - much FASTER even for nrrd images!
-        sitk.WriteImage(
-            image,   # sitk image
-            str(path), # dir plus file name
-            True # useCompression set to TRUE
-            )
+    
+    
+    def wait_image_write(self, path = None):
+        # block until the background write of path is on disk - or ALL writes, 
+         # if no path is given.  Re-raises the error of a failed write
+        with self._image_write_lock:
+            if path is not None:
+                future = self._image_writes.pop(str(path), None)
+                if future is not None:
+                    future.result()
+                return
+            while self._image_writes:
+                self._image_writes.pop(next(iter(self._image_writes))).result()
         
         
     
     
     def load_image(self, path):
-        img = sitk.ReadImage(str(path))
-        img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+        
+        # image already being read in the background - see prefetch_image()
+        future = self._image_prefetch.pop(str(path), None)
+        if future is not None:
+            img = future.result()
+        else:
+            self.wait_image_write(path) # path may be an image still being written
+            # name the ImageIO from the suffix - skips the IO factory probing the file
+             # (which can decompress compressed headers, eg. nii.gz, more than once)
+            img = _read_image(path)
+        img.SetSpacing( _UNIT_SPACING )
         return img
     
     
     
+    def prefetch_image(self, path):
+        """
+        Start reading the image at path in a background thread
+        
+        The next load_image(path) call returns this image, so reading the next 
+        image overlaps with transforming the current one.  Earlier prefetches 
+        are kept until loaded, and images are read one at a time in the order 
+        requested - so prefetching the next image before the current one is 
+        loaded does not read the current one twice.
+
+        Parameters
+        ----------
+        path : str or Path
+            Path to the image to read.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if self._image_reader is None:
+            self._image_reader = ThreadPoolExecutor(max_workers=1)
+        
+        if str(path) not in self._image_prefetch:
+            self._image_prefetch[str(path)] = self._image_reader.submit(
+                                                        _read_image, path )
+        
+    
+    
+    
     def load_transform_anno_img_ds(self, anno_path):
         
         img = self.load_image(anno_path)
@@ -1959,8 +2402,9 @@ class BrainRegister(object):
     
     def load_transform_image_img_ds(self, image_path):
         
-        img = self.load_image(image_path)
-        return self.move_image_img_ds(img)
+        # no local ref to the raw image - move_image_img_ds() can release it
+         # as soon as it is filtered
+        return self.move_image_img_ds( self.load_image(image_path) )
         
     
     
@@ -1968,6 +2412,28 @@ class BrainRegister(object):
     
     def transform_image(self, template_img, pm_list):
         
+        if ( template_img.GetPixelID() in _LABEL_REMAP_TYPES and 
+             _resample_interpolator(pm_list[-1]) == sitk.sitkNearestNeighbor ):
+            # 32/64-bit annotation : transform its uint16 label indices instead
+            img = self.transform_label_image(template_img, pm_list)
+            if img is not None:
+                return img
+        
+        if pm_list is self._displacement_field_pms and self._displacement_field is not None:
+            # same pm list as the last image : resample through its displacement field
+             # one field lookup per voxel - no re-evaluation of the transform chain
+            img = self.resample_displacement_field(template_img)
+            
+            print('')
+            print('========================================================================')
+            print('')
+            print('')
+            
+            return self.cast_image(template_img, img)
+        
+        # a NEW transformix filter per call - a filter holds its float32 result
+         # for as long as it lives, so a reused filter would keep the last 
+         # transformed (possibly full-res) volume in memory between calls
         transformixImageFilter = sitk.TransformixImageFilter()
         
         # add the first PM with Set
@@ -1978,10 +2444,40 @@ class BrainRegister(object):
         
         transformixImageFilter.SetMovingImage(template_img)
         
-        transformixImageFilter.Execute()
+        reuse = pm_list is self._displacement_field_pms
+        if reuse: # keep the deformation field of this pm list for the next images
+             # transformix also writes it to deformationField.nii in its output 
+             # dir - a temp dir, NOT the cwd, removed once transformix has run
+            transformixImageFilter.ComputeDeformationFieldOn()
+            field_dir = tempfile.mkdtemp(prefix='brainregister-transformix-')
+            transformixImageFilter.SetOutputDirectory(field_dir)
+        
+        try:
+            transformixImageFilter.Execute()
+        finally:
+            if reuse:
+                shutil.rmtree(field_dir, ignore_errors=True)
         
         img = transformixImageFilter.GetResultImage()
-        img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+        field = transformixImageFilter.GetDeformationField() if reuse else None
+        transformixImageFilter = None # img is now the ONLY ref to the result
+        
+        if reuse:
+            geometry = ( field.GetSize(), field.GetOrigin(), 
+                         field.GetSpacing(), field.GetDirection() )
+            # the transform takes its field over - only the float64 copy is kept
+            field = sitk.Cast(field, sitk.sitkVectorFloat64)
+            self._displacement_field = ( sitk.DisplacementFieldTransform(field),
+                geometry, _resample_interpolator(pm_list[-1]), 
+                float(pm_list[-1]['DefaultPixelValue'][0]) )
+            field = None
+            # the field is float32 - so check its resample of THIS image against 
+             # the transformix result, and transformix every image if they differ
+            if not _same_resample(img, self.resample_displacement_field(template_img)):
+                print('  displacement field resample differs from transformix :' + 
+                      ' transformix each image')
+                self.reuse_displacement_field() # free the field
+         # no SetSpacing here - cast_image() sets the unit geometry on its output
         
         
         print('')
@@ -1998,59 +2494,234 @@ class BrainRegister(object):
         
     
     
-    def cast_image(self, sample_template_img, sample_template_ds):
+    def transform_label_image(self, anno_img, pm_list):
+        """
+        Transform a 32/64-bit label image through its uint16 label indices
+        
+        Each label is replaced by its index in the sorted label set, the index 
+        image is transformed with pm_list, and the indices are mapped back to 
+        the labels.  Nearest neighbour interpolation only moves labels, so the 
+        result holds the original label values - even ids above 2**24 (eg. the 
+        Allen CCF structure ids), which elastix's float32 resampling rounds. 
+        The moving image is also half (or a quarter) of the size.
+        
+        The result keeps the pixel type of anno_img - so transformed uint32 
+        annotations are saved as uint32.  Before this remap they were cast to 
+        uint16, wrapping every label above 65535.
 
-        # get the minimum and maximum values in sample_template_img
+        Parameters
+        ----------
+        anno_img : sitk.Image
+            Label image - unsigned 32 or 64-bit.
+        pm_list : list of sitk.ParameterMap
+            Nearest neighbour parameter maps.
+
+        Returns
+        -------
+        sitk.Image
+            The transformed label image, same pixel type as anno_img - or None 
+            if anno_img has more labels than a uint16 index can hold.
+
+        """
+        
+        labels = self.get_image_labels(anno_img) # SORTED - labels[0] is the minimum
+        if len(labels) > _LABEL_REMAP_MAX:
+            return None
+        
+        anno_view = sitk.GetArrayViewFromImage(anno_img)
+        
+        # index each label in slabs of slices - searchsorted returns int64
+        index = np.empty(anno_view.shape, 'uint16')
+        for z in range(0, anno_view.shape[0], 16):
+            index[z:z+16] = np.searchsorted(labels, anno_view[z:z+16])
+        
+        index_img = sitk.GetImageFromArray(index)
+        index = None
+        index_img.CopyInformation(anno_img)
+        
+        # cast_image() clips to the index range - voxels outside the moving 
+         # image map to labels[0], as the clip to the label range did before
+        index_img = self.transform_image(index_img, pm_list)
+        
+        img = sitk.GetImageFromArray( labels[sitk.GetArrayViewFromImage(index_img)] )
+        img.CopyInformation(index_img)
+        # the transformed labels are a subset of labels - and still index into it
+        self.get_image_labels(img, labels)
+        return img
+        
+    
+    
+    def get_image_labels(self, img, labels = None):
+        """
+        Returns the sorted label values in the label image img
+        
+        Cached against the image object, like get_image_range(), so each 
+        annotation is only scanned once however often it is transformed.
+
+        Parameters
+        ----------
+        img : sitk.Image
+            Label image.
+        labels : numpy.ndarray, optional
+            Sorted labels to cache for img instead of scanning it - any 
+            superset of its labels. The default is None.
+
+        Returns
+        -------
+        numpy.ndarray
+            The sorted label values.
+
+        """
+        
+        entry = self._label_cache.get(id(img))
+        if entry is not None and entry[0]() is img and labels is None:
+            return entry[1]
+        
+        if labels is None:
+            labels = np.unique(sitk.GetArrayViewFromImage(img))
+        
+        # drop entries for images that have been freed
+        for key in [k for k, e in list(self._label_cache.items()) if e[0]() is None]:
+            self._label_cache.pop(key, None)
+        self._label_cache[id(img)] = ( weakref.ref(img), labels )
+        return labels
+        
+    
+    
+    def reuse_displacement_field(self, pm_list = None):
+        """
+        Reuse the displacement field of pm_list for every image it transforms
+        
+        The next transform_image() call with pm_list also computes the 
+        displacement field of the whole pm list, and later calls with pm_list 
+        resample through that field instead of re-running transformix.  The 
+        field is checked against the transformix result of that first image, 
+        and dropped if the two differ.  The field is 3 doubles per output voxel, 
+        so only reuse it for a pm list that transforms several images.  Call 
+        with no pm_list to free the field.
+
+        Parameters
+        ----------
+        pm_list : list of sitk.ParameterMap, optional
+            Parameter maps to reuse.  Unused if the resample interpolator has 
+            no sitk equivalent, or if the field does not fit in half of the 
+            available memory. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        
+        if pm_list is not None and _resample_interpolator(pm_list[-1]) is None:
+            pm_list = None # no sitk equivalent - transformix each image
+        
+        if pm_list is not None:
+            # the float32 AND float64 fields are alive while the transform is built
+             # keep half the memory for the images - unknown memory : no reuse
+            voxels = int(np.prod([int(v) for v in pm_list[-1]['Size']], dtype=np.int64))
+            available = _available_memory()
+            if available is None or voxels * _DISPLACEMENT_FIELD_BYTES > available // 2:
+                pm_list = None
+        
+        self._displacement_field_pms = pm_list
+        self._displacement_field = None
+        
+    
+    
+    def resample_displacement_field(self, template_img):
+        """
+        Resample template_img through the reused displacement field
+        
+        See reuse_displacement_field().
+
+        Parameters
+        ----------
+        template_img : sitk.Image
+            Image to resample.
+
+        Returns
+        -------
+        sitk.Image
+            The resampled image - 32-bit float, like the transformix result.
+
+        """
+        
+        transform, geometry, interpolator, default = self._displacement_field
+        return sitk.Resample(template_img, geometry[0], transform, interpolator,
+                             geometry[1], geometry[2], geometry[3], 
+                             default, sitk.sitkFloat32)
+        
+    
+    
+    def get_image_range(self, img):
+        """
+        Returns the minimum and maximum pixel values in img
+        
+        The values are cached against the image object itself, so repeated
+        transforms of the same template skip the full-volume min/max pass.  
+        Entries hold only a weakref - a freed image (whose id() may be reused) 
+        is never matched, and the cache never keeps an image alive.
+
+        Parameters
+        ----------
+        img : sitk.Image
+            Image to compute the pixel value range of.
+
+        Returns
+        -------
+        tuple
+            (minimum, maximum) pixel values as floats.
+
+        """
+        
+        entry = self._range_cache.get(id(img))
+        if entry is not None and entry[0]() is img:
+            return entry[1]
+        
         minMax = sitk.MinimumMaximumImageFilter()
-        minMax.Execute(sample_template_img)
+        minMax.Execute(img)
+        img_range = ( minMax.GetMinimum(), minMax.GetMaximum() )
         
-        # cast with numpy - as sitk casting has weird rounding errors..?
-        sample_template_ds_np = sitk.GetArrayFromImage(sample_template_ds)
+        # drop entries for images that have been freed
+        for key in [k for k, e in list(self._range_cache.items()) if e[0]() is None]:
+            self._range_cache.pop(key, None)
+        self._range_cache[id(img)] = ( weakref.ref(img), img_range )
+        return img_range
         
-        # first rescale the pixel values to those in the original matrix
+    
+    
+    def cast_image(self, sample_template_img, sample_template_ds):
+
+        # get the minimum and maximum values in sample_template_img
+         # cached - templates are transformed many times during a run
+        minimum, maximum = self.get_image_range(sample_template_img)
+        
+        # first crop the pixel values to those in the original image
         # THIS IS NEEDED as sometimes the rescaling produces values above or below
         # the ORIGINAL IMAGE - clearly this is an error, so just crop the pixel values
-        # check the number of pixels below the Minimum for example:
-        #np.count_nonzero(sample_template_ds_np < minMax.GetMinimum())
+         # clamp and cast in ITK - no numpy array copies of the image
+        clamp = sitk.ClampImageFilter()
+        clamp.SetLowerBound( minimum )
+        clamp.SetUpperBound( maximum )
+        img = clamp.Execute(sample_template_ds)
         
-        sample_template_ds_np[ 
-            sample_template_ds_np < 
-            minMax.GetMinimum() ] = minMax.GetMinimum()
-        
-        sample_template_ds_np[ 
-            sample_template_ds_np > 
-            minMax.GetMaximum() ] = minMax.GetMaximum()
-        
-        # NO NEED TO CAST NOW - this can be incorrect as if one pixel is aberrantly set below
+        # NO NEED TO RESCALE - this can be incorrect as if one pixel is aberrantly set below
         # 0 by a long way by registration quirks, this permeates into this casting, 
         # where the 0 pixels are artifically pushed up
-        #sample_template_ds_cast = np.interp(
-        #    sample_template_ds_np, 
-        #    ( sample_template_ds_np.min(), sample_template_ds_np.max() ), 
-        #    ( minMax.GetMinimum(), minMax.GetMaximum() ) 
-        #        )
         
-        # then CONVERT matrix to correct datatype
-        if sample_template_img.GetPixelIDTypeAsString() == '16-bit signed integer':
-            sample_template_ds_np = sample_template_ds_np.astype('int16')
-            
-        elif sample_template_img.GetPixelIDTypeAsString() == '8-bit signed integer':
-            sample_template_ds_np = sample_template_ds_np.astype('int8')
-            
-        elif sample_template_img.GetPixelIDTypeAsString() == '8-bit unsigned integer':
-            sample_template_ds_np = sample_template_ds_np.astype('uint8')
-            
-        elif sample_template_img.GetPixelIDTypeAsString() == '16-bit unsigned integer':
-            sample_template_ds_np = sample_template_ds_np.astype('uint16')
-            
-        else: # default cast to unsigned 16-bit
-            sample_template_ds_np = sample_template_ds_np.astype('uint16')
-        
-        # discard the np array
-        #sample_template_ds_np = None
-        
-        img = sitk.GetImageFromArray( sample_template_ds_np )
-        img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+        # then CONVERT image to correct datatype - default unsigned 16-bit
+         # values are already in range, so the cast truncates exactly like numpy astype
+        pixel_id = sample_template_img.GetPixelID()
+        if pixel_id not in _SITK_TO_NP:
+            pixel_id = sitk.sitkUInt16
+        if img.GetPixelID() != pixel_id:
+            img = sitk.Cast(img, pixel_id)
+        
+        # same geometry as an image built from an array - unit spacing, zero origin
+        img.SetSpacing( _UNIT_SPACING )
+        img.SetOrigin( _ZERO_ORIGIN )
+        img.SetDirection( _UNIT_DIRECTION )
         return img
         
 
@@ -2114,8 +2785,8 @@ class BrainRegister(object):
                     self.source_template_img_ds = self.get_template_ds()
                     self.save_template_ds()
                     # DISCARD the template_img - as this can be a large file, best to discard!
+                     # dropping the reference frees the image - no need for gc.collect()
                     self.source_template_img = None
-                    garbage = gc.collect() # run garbage collection to ensure memory is freed
                 else:
                     print('')
                     print('  source template in downsampled space exists..')
@@ -2133,8 +2804,8 @@ class BrainRegister(object):
                 if self.target_template_path_ds.exists() == False:
                     self.target_template_img_ds = self.get_template_ds()
                     self.save_template_ds()
+                    # DISCARD the template_img - dropping the reference frees the image
                     self.target_template_img = None
-                    garbage = gc.collect() # run garbage collection to ensure memory is freed
                 else:
                     print('')
                     print('  target template in downsampled space exists..')
@@ -2265,9 +2936,7 @@ class BrainRegister(object):
                     
                     print('')
                     print('  transforming and saving source images to ds..')
-                    for i, s in enumerate(self.source_image_path):
-                        print('  source image ' + str(i))
-                        self.process_image_ds(i)
+                    self.process_images_ds(len(self.source_image_path), 'source')
                     
                 else:
                     print('')
@@ -2287,9 +2956,7 @@ class BrainRegister(object):
                 if self.target_image_paths != []:
                     print('')
                     print('  transforming and saving target images to ds..')
-                    for i, s in enumerate(self.target_image_paths):
-                        print('  target image ' + str(i))
-                        self.process_image_ds(i)
+                    self.process_images_ds(len(self.target_image_paths), 'target')
                     
                 else:
                     print('')
@@ -2304,6 +2971,78 @@ class BrainRegister(object):
     
     
     
+    def process_images_ds(self, n_images, img_string):
+        '''
+        Process images at indexes 0..n_images-1 to downsampled space
+        
+        Each image is independent, so multiple images are processed in parallel
+        worker processes - one per image, up to half the cpu cores, and only as 
+        many as the available memory can hold at the largest image's peak.  
+        The workers are spawned, so a calling script must run BrainRegister 
+        under an if __name__ == '__main__' guard.
+        
+        Parameters
+        ----------
+        n_images : int
+            Number of source or target images to process.
+        
+        img_string : str
+            'source' or 'target' - used for printing progress.
+        
+        Returns
+        -------
+        None.
+        
+        '''
+        
+        if (self.downsampling_img == 'source'):
+            img_paths, img_paths_ds = self.source_image_path, self.source_image_path_ds
+        else:
+            img_paths, img_paths_ds = self.target_image_paths, self.target_image_paths_ds
+        
+        workers = min(n_images, max(1, (os.cpu_count() or 1)//2) )
+        
+        if workers > 1:
+            # each worker holds a WHOLE raw image plus its float copies - only run 
+             # as many as fit in the available memory, sized by the largest image
+             # memory that cannot be read runs the images one at a time
+            todo = [ img_paths[i] for i in range(n_images) 
+                        if img_paths_ds[i].exists() == False ]
+            available = _available_memory()
+            if todo == [] or available is None:
+                workers = 1
+            else:
+                peak = max( _ds_worker_bytes(p) for p in todo )
+                workers = max(1, min(workers, len(todo), available // max(1, peak) ) )
+        
+        if workers == 1:
+            for i in range(n_images):
+                # read the NEXT image while this one is filtered & transformed
+                if i+1 < n_images and img_paths_ds[i+1].exists() == False:
+                    self.prefetch_image(img_paths[i+1])
+                print('  '+img_string+' image ' + str(i))
+                self.process_image_ds(i)
+            
+            self._image_prefetch = {} # drop any unclaimed prefetch
+        
+        else:
+            print('  processing '+str(n_images)+' '+img_string+' images in '+
+                  str(workers)+' worker processes..')
+            threads = max(1, (os.cpu_count() or 1)//workers)
+            self.wait_image_write() # pending writes on disk before the workers start
+            # SPAWN the workers - a forked child inherits this process's ITK pool, 
+             # reader & writer threads without the threads, so a lock one of them 
+             # held stays locked in the child.  Each worker builds its own state 
+             # from the yaml file instead (scripts need an if __name__ == '__main__' 
+             # guard, as spawned workers import the main module)
+            with ProcessPoolExecutor(max_workers = workers, 
+                        mp_context = multiprocessing.get_context('spawn'), 
+                        initializer = _init_ds_worker, 
+                        initargs = (str(Path(self.yaml_path).resolve()), threads) ) as ex:
+                list(ex.map(_process_image_ds_worker, range(n_images)))
+        
+    
+    
     def process_image_ds(self, index):
         
         if (self.downsampling_img == 'source'):
@@ -2432,7 +3171,7 @@ class BrainRegister(object):
                 # source image is downsampled to target img resolution
                 # so use this to register to target img
                 
-                if self.source_template_img_ds == None:
+                if self.source_template_img_ds is None:
                     
                     if self.source_template_path_ds.exists() == True:
                         
@@ -2445,7 +3184,7 @@ class BrainRegister(object):
                         self.source_template_img_ds = self.get_template_ds()
                 
                 
-                if self.target_template_img == None:
+                if self.target_template_img is None:
                     
                     print('  loading target template image : '+ 
                                       self.target_template_path.name)
@@ -2497,25 +3236,20 @@ class BrainRegister(object):
                 # target image is downsampled to source img resolution
                 # so use source to register to ds target img
                  
-                if self.source_template_img == None:
+                if self.source_template_img is None:
                      
                      print('  loading source template image : '+ 
                                        self.source_template_path.name)
-                     self.source_template_img = sitk.ReadImage( 
-                                                 str(self.source_template_path) )
-                     self.source_template_img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+                     self.source_template_img = self.load_image( self.source_template_path )
                 
                 
-                if self.target_template_img_ds == None:
+                if self.target_template_img_ds is None:
                     
                     if self.target_template_path_ds.exists() == True:
                         
                         print('  loading ds target template image : ', 
                                         self.target_template_path_ds.name)
-                        self.target_template_img_ds = sitk.ReadImage( 
-                                             str(self.target_template_path_ds) )
-                        self.target_template_img_ds.SetSpacing( 
-                                                        tuple([1.0, 1.0, 1.0]) )
+                        self.target_template_img_ds = self.load_image( self.target_template_path_ds )
                     else:
                         print('  ds target template image does not exist -'+
                                 ' generating from target template')
@@ -2567,22 +3301,18 @@ class BrainRegister(object):
                 # target image is source img resolution
                 # so use source to register to target img
                 
-                if self.source_template_img == None:
+                if self.source_template_img is None:
                     
                     print('  loading source template image : '+ 
                                       self.source_template_path.name)
-                    self.source_template_img = sitk.ReadImage( 
-                                                str(self.source_template_path) )
-                    self.source_template_img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+                    self.source_template_img = self.load_image( self.source_template_path )
                 
                 
-                if self.target_template_img == None:
+                if self.target_template_img is None:
                     
                     print('  loading target template image : '+ 
                                       self.target_template_path.name)
-                    self.target_template_img = sitk.ReadImage( 
-                                                str(self.target_template_path) )
-                    self.target_template_img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+                    self.target_template_img = self.load_image( self.target_template_path )
                 
                 
                 # apply source-to-target filter - if requested in brp and not performed already
@@ -2652,7 +3382,7 @@ class BrainRegister(object):
                 # source image is downsampled to target img resolution
                 # register target to downsampled source image
                 
-                if self.source_template_img_ds == None:
+                if self.source_template_img_ds is None:
                     
                     if self.source_template_path_ds.exists() == True:
                         
@@ -2665,7 +3395,7 @@ class BrainRegister(object):
                         self.source_template_img_ds = self.get_template_ds()
                 
                 
-                if self.target_template_img == None:
+                if self.target_template_img is None:
                     
                     print('  loading target template image : '+ 
                                       self.target_template_path.name)
@@ -2717,14 +3447,14 @@ class BrainRegister(object):
                 # target image is downsampled to source img resolution
                 # so use source to register to ds target img
                  
-                if self.source_template_img == None:
+                if self.source_template_img is None:
                      
                      print('  loading source template image : '+ 
                                        self.source_template_path.name)
                      self.source_template_img = self.load_image(self.source_template_path)
                 
                 
-                if self.target_template_img_ds == None:
+                if self.target_template_img_ds is None:
                     
                     if self.target_template_path_ds.exists() == True:
                         
@@ -2782,14 +3512,14 @@ class BrainRegister(object):
                 # target image is source img resolution
                 # so use source to register to target img
                 
-                if self.source_template_img == None:
+                if self.source_template_img is None:
                     
                     print('  loading source template image : '+ 
                                       self.source_template_path.name)
                     self.source_template_img = self.load_image(self.source_template_path)
                 
                 
-                if self.target_template_img == None:
+                if self.target_template_img is None:
                     
                     print('  loading target template image : '+ 
                                       self.target_template_path.name)
@@ -2858,7 +3588,7 @@ class BrainRegister(object):
                                             self.brp['source-to-target-filter'] )
                 
                 
-                if self.source_template_img_ds_filt != None:
+                if self.source_template_img_ds_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    ds source template')
                     else: # filter correctly
@@ -2873,7 +3603,7 @@ class BrainRegister(object):
                                                 self.src_tar_filter_pipeline )
                     
                 
-                if self.target_template_img_filt != None:
+                if self.target_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    target template')
                     else: # filter correctly
@@ -2906,7 +3636,7 @@ class BrainRegister(object):
                                             self.brp['source-to-target-filter'] )
                 
                 
-                if self.source_template_img_filt != None:
+                if self.source_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    source template')
                     else: # filter correctly
@@ -2921,7 +3651,7 @@ class BrainRegister(object):
                                                 self.src_tar_filter_pipeline )
                     
                 
-                if self.target_template_img_filt != None:
+                if self.target_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    target template')
                     else: # filter correctly
@@ -2952,7 +3682,7 @@ class BrainRegister(object):
                 self.src_tar_filter_pipeline = self.compute_adaptive_filter(
                                             self.brp['source-to-target-filter'] )
                 
-                if self.source_template_img_filt != None:
+                if self.source_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    source template')
                     else: # filter correctly
@@ -2967,7 +3697,7 @@ class BrainRegister(object):
                                                 self.src_tar_filter_pipeline )
                     
                 
-                if self.target_template_img_ds_filt != None:
+                if self.target_template_img_ds_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    ds target template') # just log as if filtering took place
                     else: # filter correctly
@@ -3006,7 +3736,7 @@ class BrainRegister(object):
                 # source image is downsampled to target img resolution
                 
                 
-                if self.source_template_img_ds_filt != None:
+                if self.source_template_img_ds_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    ds source template')
                     else: # filter correctly
@@ -3021,7 +3751,7 @@ class BrainRegister(object):
                                                 self.tar_src_filter_pipeline )
                     
                 
-                if self.target_template_img_filt != None:
+                if self.target_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    target template')
                     else: # filter correctly
@@ -3046,7 +3776,7 @@ class BrainRegister(object):
             # target image is downsampled to source img resolution
                 
                 
-                if self.source_template_img_filt != None:
+                if self.source_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    source template')
                     else: # filter correctly
@@ -3061,7 +3791,7 @@ class BrainRegister(object):
                                                 self.src_tar_filter_pipeline )
                     
                 
-                if self.target_template_img_filt != None:
+                if self.target_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    target template')
                     else: # filter correctly
@@ -3084,7 +3814,7 @@ class BrainRegister(object):
                 # target image & source img same resolution!
                 # so no downsampling to use!
                 
-                if self.source_template_img_filt != None:
+                if self.source_template_img_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    source template')
                     else: # filter correctly
@@ -3099,7 +3829,7 @@ class BrainRegister(object):
                                                 self.src_tar_filter_pipeline )
                     
                 
-                if self.target_template_img_ds_filt != None:
+                if self.target_template_img_ds_filt is not None:
                     if self.src_tar_prefiltered: # already correctly filtered!
                         print('    target template') # just log as if filtering took place
                     else: # filter correctly
@@ -3141,17 +3871,17 @@ class BrainRegister(object):
         for pf in param_files:
             
             if pf == 'brainregister:affine':
-                pm = sitk.ReadParameterFile(
+                pm = _read_parameter_file(
                          os.path.join(BRAINREGISTER_MODULE_DIR, 'resources', 
                                  'elastix-parameter-files', '01_affine.txt') )
                 
             elif pf == 'brainregister:bspline':
-                pm = sitk.ReadParameterFile(
+                pm = _read_parameter_file(
                          os.path.join(BRAINREGISTER_MODULE_DIR, 'resources', 
                                  'elastix-parameter-files', '02_bspline.txt') )
                 
             else: # open relative file specified in pf
-                pm = sitk.ReadParameterFile( 
+                pm = _read_parameter_file( 
                       str(Path(os.path.join(str(self.brp_dir), pf)).resolve())
                 )
             
@@ -3172,15 +3902,19 @@ class BrainRegister(object):
         
         elastixImageFilter.SetParameterMap(parameter_map_vector)
         
-        elastixImageFilter.Execute()
+        # elastix writes its IterationInfo logs & TransformParameters files to a
+         # temp dir - NOT the cwd - save_pm_files() moves the pm files out and 
+         # removes the dir with all the logs in one rmtree
+        self._elastix_dir = tempfile.mkdtemp(prefix='brainregister-elastix-')
+        elastixImageFilter.SetOutputDirectory(self._elastix_dir)
+        
+        try:
+            elastixImageFilter.Execute()
+        except:
+            shutil.rmtree(self._elastix_dir, ignore_errors=True)
+            self._elastix_dir = None
+            raise
         
-        # remove the registration logs
-        reg_logs = [f for f in os.listdir('.') if 
-                    os.path.isfile(f) & 
-                    os.path.basename(f).startswith("IterationInfo.")]
-        for rl in reg_logs:
-            os.remove(rl)
-            
         
         print('')
         print('========================================================================')
@@ -3189,21 +3923,33 @@ class BrainRegister(object):
         
         # get the registered image
         img = elastixImageFilter.GetResultImage()
-        img.SetSpacing( tuple([1.0, 1.0, 1.0]) )
+        img.SetSpacing( _UNIT_SPACING )
         return img
     
     
     
     def save_pm_files(self, pm_paths):
         
-        # move TransformParameters files to pm_paths
-        transform_params = [f for f in os.listdir('.') if os.path.isfile(f) & 
-                            os.path.basename(f).startswith("TransformParameters.")]
-        
-        transform_params.sort() # into ASCENDING ORDER
+        # move TransformParameters files from the elastix output dir to pm_paths
+        with os.scandir(self._elastix_dir) as it:
+            transform_params = sorted( # into ASCENDING ORDER
+                        e.path for e in it if e.name.startswith("TransformParameters.") 
+                            and e.is_file(follow_symlinks=False) )
         
         for i, tp in enumerate(transform_params):
-            os.rename(tp, str(pm_paths[i]) )
+            shutil.move(tp, str(pm_paths[i]) ) # temp dir may be on another filesystem
+            
+            if i > 0: # each pm after the first is initialised from the previous one
+                 # elastix wrote the temp dir path - point it to the saved pm file
+                pm_txt = pm_paths[i].read_text()
+                pm_txt = _INITIAL_TRANSFORM_RE.sub(
+                            '(InitialTransformParameterFileName "' +
+                            str(pm_paths[i-1]).replace('\\', '/') + '")', pm_txt)
+                pm_paths[i].write_text(pm_txt)
+        
+        # remove the registration logs with the dir
+        shutil.rmtree(self._elastix_dir, ignore_errors=True)
+        self._elastix_dir = None
         
         
     
@@ -3211,9 +3957,16 @@ class BrainRegister(object):
     def load_pm_files(self, pm_paths ):
         
         if pm_paths[0].exists() == True: # assume if first pm file exists they all do!
-            pms = []
-            for pm in pm_paths:
-                pms.append(sitk.ReadParameterFile( str(pm) ) )
+            # each file is parsed ONCE per process (until it changes on disk)
+             # repeat loads of the same pm files return copies from memory
+            if len(pm_paths) == 1:
+                return [ _read_parameter_file( str(pm_paths[0]) ) ]
+            
+            # read multiple pm files concurrently - independent file reads
+             # map() returns the pms in the same order as pm_paths
+            with ThreadPoolExecutor(max_workers=min(4, len(pm_paths))) as ex:
+                pms = list(ex.map(lambda pm: _read_parameter_file( str(pm) ), 
+                                  pm_paths))
             
             return pms
         else:
@@ -3227,16 +3980,13 @@ class BrainRegister(object):
 
         Returns
         -------
-        None.
+        bool
+            True if every src_tar_pm file exists - stops checking at the 
+            first missing file.
 
         """
         
-        exists = True
-        for pm in self.src_tar_pm_paths:
-            if pm.exists() is False:
-                exists = False
-        
-        return exists
+        return all(pm.exists() for pm in self.src_tar_pm_paths)
         
     
     
@@ -3246,16 +3996,13 @@ class BrainRegister(object):
 
         Returns
         -------
-        None.
+        bool
+            True if every tar_src_pm file exists - stops checking at the 
+            first missing file.
 
         """
         
-        exists = True
-        for pm in self.tar_src_pm_paths:
-            if pm.exists() is False:
-                exists = False
-        
-        return exists
+        return all(pm.exists() for pm in self.tar_src_pm_paths)
         
     
     
@@ -3346,6 +4093,10 @@ class BrainRegister(object):
                 print('')
                 print('  source images to target :')
                 print('')
+                if len(self.source_image_path_target) > 1:
+                    # every image uses the same pm list - compute its displacement 
+                     # field with the first image, and resample the rest through it
+                    self.reuse_displacement_field(self.src_tar_pm)
                 for i,im_ds in enumerate(self.source_image_path_target):
                     # source_image_path + _ds + _target all are SAME LENGTH!
                     print('  source image ' + str(i))
@@ -3353,6 +4104,7 @@ class BrainRegister(object):
                     # save to local var, do not hold onto refs with self.source_image_img_target[i].append()
                     # user can use load_src_images_tar() to do this!s
                     self.save_src_image_tar(i, img_tar)
+                self.reuse_displacement_field() # free the field
             else:
                 print('')
                 print('  source images to target : no further images')
@@ -3364,8 +4116,10 @@ class BrainRegister(object):
             print('')
             
         
-        # discard from memory all images/martices not needed - just point vars to blank list!
-        garbage = gc.collect() # run garbage collection to ensure memory is freed
+        self.wait_image_write() # all of this stage's images are on disk
+        
+        # images/matrices not needed are freed as their references go out of scope
+         # - no need for gc.collect()
         
         
     
@@ -3423,6 +4177,10 @@ class BrainRegister(object):
                 print('')
                 print('  target images to source :')
                 print('')
+                if len(self.target_image_paths_source) > 1:
+                    # every image uses the same pm list - compute its displacement 
+                     # field with the first image, and resample the rest through it
+                    self.reuse_displacement_field(self.tar_src_pm)
                 for i,im_ds in enumerate(self.target_image_paths_source):
                     # source_image_path + _ds + _target all are SAME LENGTH!
                     print('  target image ' + str(i))
@@ -3430,6 +4188,7 @@ class BrainRegister(object):
                     # save to local var, do not hold onto refs with self.source_image_img_target[i].append()
                     # user can use load_src_images_tar() to do this!s
                     self.save_tar_image_src(i, img_tar)
+                self.reuse_displacement_field() # free the field
             else:
                 print('')
                 print('  target images to source : no further images')
@@ -3441,8 +4200,10 @@ class BrainRegister(object):
             print('')
             
         
-        # discard from memory all images/martices not needed - just point vars to blank list!
-        garbage = gc.collect() # run garbage collection to ensure memory is freed
+        self.wait_image_write() # all of this stage's images are on disk
+        
+        # images/matrices not needed are freed as their references go out of scope
+         # - no need for gc.collect()
         
         
     
@@ -3466,7 +4227,7 @@ class BrainRegister(object):
             
             if self.source_template_path_target.exists() == False: 
                 # only transform if output does not exist
-                if self.source_template_img_target == None: 
+                if self.source_template_img_target is None: 
                     # and if the output image is not already loaded!
                     
                     self.source_template_img_ds = self.get_template_ds()
@@ -3496,6 +4257,9 @@ class BrainRegister(object):
                     return self.source_template_img_target
             
             else:
+                if self.source_template_img_target is not None: # already in memory - skip the disk read
+                    print('  downsampled source template to target space exists - returning image..')
+                    return self.source_template_img_target
                 print('  downsampled source template to target space exists - loading image..')
                 self.source_template_img_target = self.load_image(self.source_template_path_target)
                 return self.source_template_img_target
@@ -3506,7 +4270,7 @@ class BrainRegister(object):
             
             if self.source_template_path_target.exists() == False: 
                 # only transform if output does not exist
-                if self.source_template_img_target == None: 
+                if self.source_template_img_target is None: 
                     # and if the output image is not already loaded!
                     
                     # get source image
@@ -3542,6 +4306,9 @@ class BrainRegister(object):
                     return self.source_template_img_target
             
             else:
+                if self.source_template_img_target is not None: # already in memory - skip the disk read
+                    print('  source template to target space exists - returning image..')
+                    return self.source_template_img_target
                 print('  source template to target space exists - loading image..')
                 self.source_template_img_target = self.load_image(self.source_template_path_target)
                 return self.source_template_img_target
@@ -3552,7 +4319,7 @@ class BrainRegister(object):
             
             if self.source_template_path_target.exists() == False: 
                 # only transform if output does not exist
-                if self.source_template_img_target == None: 
+                if self.source_template_img_target is None: 
                     # and if the output image is not already loaded!
                     
                     if self.source_template_img is None: # AND path exists!
@@ -3584,6 +4351,9 @@ class BrainRegister(object):
                     return self.source_template_img_target
             
             else:
+                if self.source_template_img_target is not None: # already in memory - skip the disk read
+                    print('  source template to target space exists - returning image..')
+                    return self.source_template_img_target
                 print('  source template to target space exists - loading image..')
                 self.source_template_img_target = self.load_image(self.source_template_path_target)
                 return self.source_template_img_target
@@ -3594,7 +4364,7 @@ class BrainRegister(object):
     def save_src_template_tar(self):
         
         if self.source_template_path_target.exists() == False:
-            if self.source_template_img_target != None:
+            if self.source_template_img_target is not None:
                 print('  saving source template to target : ' + 
                       self.get_relative_path(self.source_template_path_target))
                 self.save_image(self.source_template_img_target, self.source_template_path_target)
@@ -3616,7 +4386,7 @@ class BrainRegister(object):
             
             if self.source_anno_path_target[index].exists() == False: 
                 # only transform if output does not exist
-                if self.source_anno_img_target[index] == None: 
+                if self.source_anno_img_target[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     if im_path.exists() == False:
@@ -3631,7 +4401,7 @@ class BrainRegister(object):
                     if self.src_tar_pm_anno is None:
                         print('  source to target annotation paramater maps not loaded - loading files..')
                         self.src_tar_pm = self.load_pm_files( self.src_tar_pm_paths )
-                        if self.src_tar_pm == None:
+                        if self.src_tar_pm is None:
                             print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                         self.src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
                     
@@ -3666,7 +4436,7 @@ class BrainRegister(object):
             
             if self.source_anno_path_target[index].exists() == False: 
                 # only transform if output does not exist
-                if self.source_anno_img_target[index] == None: 
+                if self.source_anno_img_target[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     print('  loading source annotation..')
@@ -3676,7 +4446,7 @@ class BrainRegister(object):
                     if self.src_tar_pm_anno is None:
                         print('  source to target annotation paramater maps not loaded - loading files..')
                         self.src_tar_pm = self.load_pm_files( self.src_tar_pm_paths )
-                        if self.src_tar_pm == None:
+                        if self.src_tar_pm is None:
                             print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                         self.src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
                     
@@ -3711,7 +4481,7 @@ class BrainRegister(object):
             
             if self.source_anno_path_target[index].exists() == False: 
                 # only transform if output does not exist
-                if self.source_anno_img_target[index] == None: 
+                if self.source_anno_img_target[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     print('  loading source annotation..')
@@ -3721,7 +4491,7 @@ class BrainRegister(object):
                     if self.src_tar_pm_anno is None:
                         print('  source to target annotation paramater maps not loaded - loading files..')
                         self.src_tar_pm = self.load_pm_files( self.src_tar_pm_paths )
-                        if self.src_tar_pm == None:
+                        if self.src_tar_pm is None:
                             print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                         self.src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
                     
@@ -3779,14 +4549,16 @@ class BrainRegister(object):
     
     def get_src_image_tar(self, index):
         
+        out_path = self.source_image_path_target[index] # index this image's output path ONCE
+        
         
         if (self.downsampling_img == 'source'):
             # ds source images to target img 
             im_path = self.source_image_path_ds[index]
             
-            if self.source_image_path_target[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.source_image_img_target[index] == None: 
+                if self.source_image_img_target[index] is None: 
                     # and if the output image is not already loaded!
                     
                     if im_path.exists() == False:
@@ -3825,7 +4597,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled source image to target space exists - loading image..')
-                img_tar = self.load_image(self.source_image_path_target[index])
+                img_tar = self.load_image(out_path)
                 return img_tar
             
             
@@ -3833,9 +4605,9 @@ class BrainRegister(object):
             # source anno to ds target THEN ds to target image space
             im_path = self.source_image_path[index]
             
-            if self.source_image_path_target[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.source_image_img_target[index] == None: 
+                if self.source_image_img_target[index] is None: 
                     # and if the output image is not already loaded!
                     
                     print('  loading source image..')
@@ -3869,7 +4641,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled source image to target space exists - loading image..')
-                img_tar = self.load_image(self.source_image_path_target[index])
+                img_tar = self.load_image(out_path)
                 return img_tar
             
             
@@ -3877,9 +4649,9 @@ class BrainRegister(object):
             # source anno to ds target THEN ds to target image space
             im_path = self.source_image_path[index]
             
-            if self.source_image_path_target[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.source_image_img_target[index] == None: 
+                if self.source_image_img_target[index] is None: 
                     # and if the output image is not already loaded!
                     
                     print('  loading source image..')
@@ -3912,7 +4684,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled source image to target space exists - loading image..')
-                img_tar = self.load_image(self.source_image_path_target[index])
+                img_tar = self.load_image(out_path)
                 return img_tar
         
         
@@ -3921,12 +4693,14 @@ class BrainRegister(object):
     
     def save_src_image_tar(self, index, image):
         
+        out_path = self.source_image_path_target[index] # index this image's output path ONCE
+        
         #if (self.downsampling_img == 'source'):
         # ds source images to target img 
-        if self.source_image_path_target[index].exists() == False: # only save if output does not exist
+        if out_path.exists() == False: # only save if output does not exist
             print('  saving source image to target : ' +
-                  self.get_relative_path(self.source_image_path_target[index] ) )
-            self.save_image(image, self.source_image_path_target[index])
+                  self.get_relative_path(out_path) )
+            self.save_image(image, out_path)
         
         
     
@@ -3965,7 +4739,7 @@ class BrainRegister(object):
             
             if self.target_template_path_source.exists() == False: 
                 # only transform if output does not exist
-                if self.target_template_img_source == None: 
+                if self.target_template_img_source is None: 
                     # and if the output image is not already loaded!
                     
                     self.target_template_img_ds = self.get_template_ds()
@@ -3995,6 +4769,9 @@ class BrainRegister(object):
                     return self.target_template_img_source
             
             else:
+                if self.target_template_img_source is not None: # already in memory - skip the disk read
+                    print('  downsampled target template to source space exists - returning image..')
+                    return self.target_template_img_source
                 print('  downsampled target template to source space exists - loading image..')
                 self.target_template_img_source = self.load_image(self.target_template_path_source)
                 return self.target_template_img_source
@@ -4005,7 +4782,7 @@ class BrainRegister(object):
             
             if self.target_template_path_source.exists() == False: 
                 # only transform if output does not exist
-                if self.target_template_img_source == None: 
+                if self.target_template_img_source is None: 
                     # and if the output image is not already loaded!
                     
                     # get source image
@@ -4041,6 +4818,9 @@ class BrainRegister(object):
                     return self.target_template_img_source
             
             else:
+                if self.target_template_img_source is not None: # already in memory - skip the disk read
+                    print('  target template to source space exists - returning image..')
+                    return self.target_template_img_source
                 print('  target template to source space exists - loading image..')
                 self.target_template_img_source = self.load_image(self.target_template_path_source)
                 return self.target_template_img_source
@@ -4051,7 +4831,7 @@ class BrainRegister(object):
             
             if self.target_template_path_source.exists() == False: 
                 # only transform if output does not exist
-                if self.target_template_img_source == None: 
+                if self.target_template_img_source is None: 
                     # and if the output image is not already loaded!
                     
                     if self.target_template_img is None: # AND path exists!
@@ -4083,6 +4863,9 @@ class BrainRegister(object):
                     return self.target_template_img_source
             
             else:
+                if self.target_template_img_source is not None: # already in memory - skip the disk read
+                    print('  target template to source space exists - returning image..')
+                    return self.target_template_img_source
                 print('  target template to source space exists - loading image..')
                 self.target_template_img_source = self.load_image(self.target_template_path_source)
                 return self.target_template_img_source
@@ -4093,7 +4876,7 @@ class BrainRegister(object):
     def save_tar_template_src(self):
         
         if self.target_template_path_source.exists() == False:
-            if self.source_template_img_target != None:
+            if self.source_template_img_target is not None:
                 print('  saving target template to source : ' + 
                       self.get_relative_path(self.target_template_path_source))
                 self.save_image(self.target_template_img_source, self.target_template_path_source)
@@ -4115,7 +4898,7 @@ class BrainRegister(object):
             
             if self.target_anno_path_source[index].exists() == False: 
                 # only transform if output does not exist
-                if self.target_anno_img_source[index] == None: 
+                if self.target_anno_img_source[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     if im_path.exists() == False:
@@ -4130,7 +4913,7 @@ class BrainRegister(object):
                     if self.tar_src_pm_anno is None:
                         print('  target to source annotation paramater maps not loaded - loading files..')
                         self.tar_src_pm = self.load_pm_files( self.tar_src_pm_paths )
-                        if self.tar_src_pm == None:
+                        if self.tar_src_pm is None:
                             print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                         self.tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
                     
@@ -4166,7 +4949,7 @@ class BrainRegister(object):
             
             if self.target_anno_path_source[index].exists() == False: 
                 # only transform if output does not exist
-                if self.target_anno_img_source[index] == None: 
+                if self.target_anno_img_source[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     print('  loading target annotation..')
@@ -4176,7 +4959,7 @@ class BrainRegister(object):
                     if self.tar_src_pm_anno is None:
                         print('  target to source annotation paramater maps not loaded - loading files..')
                         self.tar_src_pm = self.load_pm_files( self.tar_src_pm_paths )
-                        if self.tar_src_pm == None:
+                        if self.tar_src_pm is None:
                             print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                         self.tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
                     
@@ -4211,7 +4994,7 @@ class BrainRegister(object):
             
             if self.target_anno_path_source[index].exists() == False: 
                 # only transform if output does not exist
-                if self.target_anno_img_source[index] == None: 
+                if self.target_anno_img_source[index] is None: 
                     # and if the output anno is not already loaded!
                     
                     print('  loading downsampled target annotation..')
@@ -4221,7 +5004,7 @@ class BrainRegister(object):
                     if self.tar_src_pm_anno is None:
                         print('  target to source annotation paramater maps not loaded - loading files..')
                         self.tar_src_pm = self.load_pm_files( self.tar_src_pm_paths )
-                        if self.tar_src_pm == None:
+                        if self.tar_src_pm is None:
                             print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                         self.tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
                     
@@ -4280,14 +5063,16 @@ class BrainRegister(object):
     
     def get_tar_image_src(self, index):
         
+        out_path = self.target_image_paths_source[index] # index this image's output path ONCE
+        
         
         if (self.downsampling_img == 'target'):
             # ds target images to source img 
             im_path = self.target_image_paths_ds[index]
             
-            if self.target_image_paths_source[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.target_image_img_source[index] == None: 
+                if self.target_image_img_source[index] is None: 
                     # and if the output image is not already loaded!
                     
                     if im_path.exists() == False:
@@ -4326,7 +5111,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled target image to source space exists - loading image..')
-                img_src = self.load_image(self.target_image_paths_source[index])
+                img_src = self.load_image(out_path)
                 # not saving to self.target_image_img_source[index] to minimise memory occupation
                 return img_src
             
@@ -4335,9 +5120,9 @@ class BrainRegister(object):
             # target anno to ds source THEN ds to source image space
             im_path = self.target_image_path[index]
             
-            if self.target_image_paths_source[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.target_image_img_source[index] == None: 
+                if self.target_image_img_source[index] is None: 
                     # and if the output image is not already loaded!
                     
                     print('  loading downsampled target image..')
@@ -4371,7 +5156,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled target image to source space exists - loading image..')
-                img_src = self.load_image(self.target_image_paths_source[index])
+                img_src = self.load_image(out_path)
                 # not saving to self.target_image_img_source[index] to minimise memory occupation
                 return img_src
             
@@ -4380,9 +5165,9 @@ class BrainRegister(object):
             # target anno to source image space (no downsampling)
             im_path = self.target_image_path[index]
             
-            if self.target_image_paths_source[index].exists() == False: 
+            if out_path.exists() == False: 
                 # only transform if output does not exist
-                if self.target_image_img_source[index] == None: 
+                if self.target_image_img_source[index] is None: 
                     # and if the output image is not already loaded!
                     
                     print('  loading downsampled target image..')
@@ -4415,7 +5200,7 @@ class BrainRegister(object):
                 
             else:
                 print('  downsampled target image to source space exists - loading image..')
-                img_src = self.load_image(self.target_image_paths_source[index])
+                img_src = self.load_image(out_path)
                 # not saving to self.target_image_img_source[index] to minimise memory occupation
                 return img_src
         
@@ -4425,12 +5210,14 @@ class BrainRegister(object):
     
     def save_tar_image_src(self, index, image):
         
+        out_path = self.target_image_paths_source[index] # index this image's output path ONCE
+        
         #if (self.downsampling_img == 'source'):
         # ds target images to source img 
-        if self.target_image_paths_source[index].exists() == False: # only save if output does not exist
+        if out_path.exists() == False: # only save if output does not exist
             print('  saving target image to source : ' +
-                  self.get_relative_path(self.target_image_paths_source[index] ) )
-            self.save_image(image, self.target_image_paths_source[index])
+                  self.get_relative_path(out_path) )
+            self.save_image(image, out_path)
         
         
     
@@ -4451,16 +5238,28 @@ class BrainRegister(object):
     
     def edit_pms_nearest_neighbour(self, pms):
         
-        if pms == None:
+        if pms is None:
             return None # this is so initial calls in resolve_param_paths()
                         # is set to None if pm files dont exist
         else:
             # FIRST alter the pm files FinalBSplineInterpolationOrder to 0
             # 0 - nearest neighbour interpolation for annotation images
+             # on COPIES - editing in place would switch the shared image pms 
+             # to nearest neighbour too
+             # the copies are cached per pms list - repeat calls return the SAME
+             # nearest neighbour list (the entry holds pms, so its id stays valid)
+            entry = self._nn_pm_cache.get(id(pms))
+            if entry is not None and entry[0] is pms:
+                return entry[1]
+            
+            pms_nn = []
             for pm in pms:
-                pm['FinalBSplineInterpolationOrder'] = tuple( [ str(0) ] )
+                pm_nn = sitk.ParameterMap(pm)
+                pm_nn['FinalBSplineInterpolationOrder'] = tuple( [ str(0) ] )
+                pms_nn.append(pm_nn)
             
-            return pms
+            self._nn_pm_cache[id(pms)] = ( pms, pms_nn )
+            return pms_nn
     
     
     
@@ -4521,7 +5320,7 @@ class BrainRegister(object):
                 
                 if self.target_template_path_ds.exists() == False: 
                     # only transform if output does not exist
-                    if self.target_template_img == None:
+                    if self.target_template_img is None:
                         print('  loading target template image : ' + 
                           self.get_relative_path(self.target_template_path) )
                         self.target_template_img = self.load_image(self.target_template_path)
@@ -4549,7 +5348,7 @@ class BrainRegister(object):
                     self.save_image(img_ds_src, self.target_template_path_ds)
                     
                     self.target_template_img = None
-                    garbage = gc.collect() # run garbage collection to ensure memory is freed
+                     # dropping the reference frees the image - no need for gc.collect()
                     
                     
                 else:
@@ -4568,7 +5367,7 @@ class BrainRegister(object):
                 
                 if self.source_template_path_ds.exists() == False: 
                     # only transform if output does not exist
-                    if self.source_template_img == None:
+                    if self.source_template_img is None:
                         print('  loading source template image : ' + 
                           self.get_relative_path(self.source_template_path) )
                         self.source_template_img = self.load_image(self.source_template_path)
@@ -4595,7 +5394,7 @@ class BrainRegister(object):
                     self.save_image(img_ds_tar, self.source_template_path_ds)
                     
                     self.source_template_img = None
-                    garbage = gc.collect() # run garbage collection to ensure memory is freed
+                     # dropping the reference frees the image - no need for gc.collect()
                     
                     
                 else:
@@ -4625,7 +5424,7 @@ class BrainRegister(object):
                         
                         if self.target_anno_path_ds[i].exists() == False: 
                             # only transform if output does not exist
-                            if self.target_anno_img[i] == None:
+                            if self.target_anno_img[i] is None:
                                 print('  loading target anno image : ' + 
                                   self.get_relative_path(self.target_anno_path[i]) )
                                 tar_anno_img = self.load_image(self.target_anno_path[i])
@@ -4636,7 +5435,7 @@ class BrainRegister(object):
                             if self.tar_src_pm is None:
                                 print('  target to source paramater maps not loaded - loading files..')
                                 self.tar_src_pm = self.load_pm_files( self.tar_src_pm_paths )
-                                if self.tar_src_pm == None:
+                                if self.tar_src_pm is None:
                                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                                 self.tar_src_pm_anno = self.edit_pms_nearest_neighbour(self.tar_src_pm)
                             
@@ -4685,7 +5484,7 @@ class BrainRegister(object):
                         
                         if self.source_anno_path_ds[i].exists() == False: 
                             # only transform if output does not exist
-                            if self.source_anno_img[i] == None:
+                            if self.source_anno_img[i] is None:
                                 print('  loading source anno image : ' + 
                                   self.get_relative_path(self.source_anno_path[i]) )
                                 src_anno_img = self.load_image(self.source_anno_path[i])
@@ -4696,7 +5495,7 @@ class BrainRegister(object):
                             if self.src_tar_pm is None:
                                 print('  source to target paramater maps not loaded - loading files..')
                                 self.src_tar_pm = self.load_pm_files( self.src_tar_pm_paths )
-                                if self.src_tar_pm == None:
+                                if self.src_tar_pm is None:
                                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                                 self.src_tar_pm_anno = self.edit_pms_nearest_neighbour(self.src_tar_pm)
                             
@@ -4750,7 +5549,7 @@ class BrainRegister(object):
                         
                         if self.target_image_paths_ds[i].exists() == False: 
                             # only transform if output does not exist
-                            if self.target_image_imgs[i] == None:
+                            if self.target_image_imgs[i] is None:
                                 print('  loading target image : ' + 
                                   self.get_relative_path(self.target_image_paths[i]) )
                                 tar_img = self.load_image(self.target_image_paths[i])
@@ -4761,7 +5560,7 @@ class BrainRegister(object):
                             if self.tar_src_pm is None:
                                 print('  target to source paramater maps not loaded - loading files..')
                                 self.tar_src_pm = self.load_pm_files( self.tar_src_pm_paths )
-                                if self.tar_src_pm == None:
+                                if self.tar_src_pm is None:
                                     print("ERROR : tar_src_ds_pm files do not exist - run register() first")
                             
                             print('  transforming target image to downsampled source..')
@@ -4809,7 +5608,7 @@ class BrainRegister(object):
                         
                         if self.source_anno_path_ds[i].exists() == False: 
                             # only transform if output does not exist
-                            if self.source_image_imgs[i] == None:
+                            if self.source_image_imgs[i] is None:
                                 print('  loading source image : ' + 
                                   self.get_relative_path(self.source_image_paths[i]) )
                                 src_img = self.load_image(self.source_image_paths[i])
@@ -4820,7 +5619,7 @@ class BrainRegister(object):
                             if self.src_tar_pm is None:
                                 print('  source to target paramater maps not loaded - loading files..')
                                 self.src_tar_pm = self.load_pm_files( self.src_tar_pm_paths )
-                                if self.src_tar_pm == None:
+                                if self.src_tar_pm is None:
                                     print("ERROR : src_tar_ds_pm files do not exist - run register() first")
                             
                             print('  transforming source image to downsampled target..')
@@ -4860,10 +5659,129 @@ class BrainRegister(object):
 
 
 
+class _SeparableMeanImageFilter(object):
+    """
+    Mean (box) filter run as one 1D pass per axis
+    
+    A box mean IS separable, so three 1D passes do O(rx+ry+rz) work per voxel
+    instead of O(rx*ry*rz) for the 3D neighbourhood - a large saving at the 
+    radii used for prefiltering.  Passes accumulate in float64 and the sum is 
+    rounded back before the final divide, so integer images match 
+    sitk.MeanImageFilter exactly.  Float images use sitk.MeanImageFilter, as 
+    the reordered sum is not bit-identical for them.
+    
+    NB: the median filter is NOT separable - it stays a single 3D pass.
+    """
+    
+    def __init__(self, radius):
+        self.radius = radius
+        self.count = float(np.prod([(2*r)+1 for r in radius]))
+        self.threads = None # None - use the ITK global default
+    
+    
+    def SetNumberOfThreads(self, threads):
+        self.threads = threads
+    
+    
+    def mean_filter(self, radius):
+        flt = sitk.MeanImageFilter()
+        flt.SetRadius(radius)
+        if self.threads is not None:
+            flt.SetNumberOfThreads(self.threads)
+        return flt
+    
+    
+    def Execute(self, img):
+        
+        if ( 'integer' not in img.GetPixelIDTypeAsString() or 
+             sum(r > 0 for r in self.radius) < 2 ):
+            return self.mean_filter(self.radius).Execute(img)
+        
+        out = sitk.Cast(img, sitk.sitkFloat64)
+        for axis, r in enumerate(self.radius):
+            if r > 0:
+                radius = [0, 0, 0]
+                radius[axis] = r
+                out = self.mean_filter(radius).Execute(out)
+        
+        out = sitk.Round(out * self.count) / self.count # exact neighbourhood sum / count
+        return sitk.Cast(out, img.GetPixelID())
+    
+    
+
+
+class _PlanarGaussianImageFilter(object):
+    """
+    Recursive gaussian run only along the axes with a non-zero sigma
+    
+    SmoothingRecursiveGaussianImageFilter rejects a zero sigma, so a 2D 
+    kernel such as G,10,10,0 smooths each slice in XY with one 1D recursive 
+    pass per axis - no work at all along Z.  ITK already threads each pass 
+    across the slices.  Output is float32, as for the 3D filter.
+    """
+    
+    def __init__(self, sigma):
+        self.sigma = sigma
+        self.threads = None # None - use the ITK global default
+    
+    
+    def SetNumberOfThreads(self, threads):
+        self.threads = threads
+    
+    
+    def Execute(self, img):
+        
+        out = img
+        for axis, s in enumerate(self.sigma):
+            if s > 0:
+                flt = sitk.RecursiveGaussianImageFilter()
+                flt.SetSigma(s)
+                flt.SetDirection(axis)
+                if self.threads is not None:
+                    flt.SetNumberOfThreads(self.threads)
+                out = flt.Execute(out)
+        return out
+    
+    
+
+
+def _median_filter(kernel):
+    flt = sitk.MedianImageFilter()
+    flt.SetRadius(kernel)
+    return flt
+
+
+def _gaussian_filter(kernel):
+    # recursive (IIR) gaussian - cost is independent of sigma, and it measured 
+     # faster than DiscreteGaussianImageFilter even at sigma 1 (~0.3s vs 0.45s 
+     # on a 200x200x100 uint16 volume, 3x slower at sigma 3)
+    if 0 in kernel: # eg. G,10,10,0 - 2D (per slice) smoothing
+        return _PlanarGaussianImageFilter(kernel)
+    flt = sitk.SmoothingRecursiveGaussianImageFilter()
+    flt.SetSigma(kernel)
+    return flt
+
+
+# ImageFilterPipeline filter string : one CODE,k,k,k group per filter
+_FILTER_RE = re.compile(r'([A-Z]+)((?:,\d+)+)')
+
+# filter code : (filter constructor taking the kernel, filter name)
+_FILTER_DISPATCH = {
+    'M' : (_median_filter, 'Median'),
+    'E' : (_SeparableMeanImageFilter, 'Mean'),
+    'G' : (_gaussian_filter, 'Gaussian'),
+    'GH' : (_gaussian_filter, 'Gaussian-High-Pass'),
+    }
+
+
+
+
 class ImageFilterPipeline(object):
     
     
-    def __init__(self, filter_string):
+    def __init__(self, filter_string, num_threads = None):
+        
+        _configure_sitk_threads()
         
         self.img_filter = []
         self.img_filter_name = []
@@ -4871,47 +5789,21 @@ class ImageFilterPipeline(object):
         # process string to determine the filter pipe
         # eg. M,1,1,0-GH,10,10,4 -> translates to 
             # median 4x4 XY THEN gaussian high-pass 10x10x4 XYZ
-        filter_list = filter_string.split(sep='-')
-        
-        for f in filter_list:
+        for m in _FILTER_RE.finditer(filter_string):
             
-            filter_code = ''.join([c for c in f if c.isupper()])
-            filter_kernel = tuple([int(s) for s in f.split(',') if s.isdigit()])
+            filter_code = m.group(1)
+            filter_kernel = tuple( int(k) for k in m.group(2)[1:].split(',') )
             
-            if filter_code == 'M':
+            if filter_code in _FILTER_DISPATCH:
                 
-                flt = sitk.MedianImageFilter()
-                flt.SetRadius(filter_kernel)
-                
-                self.img_filter.append(flt)
-                self.img_filter_name.append('Median')
-                self.img_filter_kernel.append(filter_kernel)
+                make_filter, filter_name = _FILTER_DISPATCH[filter_code]
                 
-            elif filter_code == 'E':
-                
-                flt = sitk.MeanImageFilter()
-                flt.SetRadius(filter_kernel)
-                
-                self.img_filter.append(flt)
-                self.img_filter_name.append('Mean')
-                self.img_filter_kernel.append(filter_kernel)
-                
-            elif filter_code == 'G':
-                
-                flt = sitk.SmoothingRecursiveGaussianImageFilter()
-                flt.SetSigma(filter_kernel)
+                flt = make_filter(filter_kernel)
+                if num_threads is not None: # override the ITK global default
+                    flt.SetNumberOfThreads(num_threads)
                 
                 self.img_filter.append(flt)
-                self.img_filter_name.append('Gaussian')
-                self.img_filter_kernel.append(filter_kernel)
-                
-            elif filter_code == 'GH':
-                
-                flt = sitk.SmoothingRecursiveGaussianImageFilter()
-                flt.SetSigma(filter_kernel)
-                
-                self.img_filter.append(flt)
-                self.img_filter_name.append('Gaussian-High-Pass')
+                self.img_filter_name.append(filter_name)
                 self.img_filter_kernel.append(filter_kernel)
                 
             
@@ -4973,7 +5865,28 @@ class ImageFilterPipeline(object):
         for i, f in enumerate(self.img_filter):
             #print('    Filter Type : ' + self.img_filter_name[i])
             #print('    Filter Kernel : ' + str(self.img_filter_kernel[i]) )
-            img = f.Execute(img)
+            if self.img_filter_name[i] == 'Gaussian-High-Pass':
+                # high-pass : image MINUS its gaussian smoothing
+                 # subtract IN PLACE into the float32 copy of the image - the only
+                 # new volume, geometry included (numpy needed an array AND a copy)
+                smoothed = f.Execute(img)
+                high_pass = sitk.Cast(img, sitk.sitkFloat32)
+                high_pass -= smoothed
+                smoothed = None # free the smoothed image now
+                # centre the signed response on the input MEAN, and clamp to the 
+                 # input range in the input pixel type - negative responses stay 
+                 # below the mean (a flat region is the mean), and cast steps never 
+                 # see negative values, which wrap round in unsigned pixel types
+                stats = sitk.StatisticsImageFilter()
+                stats.Execute(img)
+                high_pass += stats.GetMean()
+                img = sitk.Clamp(high_pass, img.GetPixelID(), 
+                                 stats.GetMinimum(), stats.GetMaximum() )
+                high_pass = None
+            else:
+                img = f.Execute(img)
+            # rebinding img frees the previous stage output - self.img is kept 
+             # for cast_image(), so at most input + 2 stage volumes are alive
             
         self.filtered_img = img
         
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+import brainregister
+
+
+def _affine_pm(size, interpolator, order = '3'):
+    # rotation + sub-voxel translation : border voxels map outside the moving image
+    pm = sitk.ParameterMap()
+    angle = 0.1
+    c, s = float(np.cos(angle)), float(np.sin(angle))
+    params = [c, -s, 0.0, s, c, 0.0, 0.0, 0.0, 1.0, 2.7, -1.3, 0.6]
+    pm['Transform'] = ['AffineTransform']
+    pm['NumberOfParameters'] = ['12']
+    pm['TransformParameters'] = [repr(p) for p in params]
+    pm['CenterOfRotationPoint'] = [repr((n-1)/2) for n in size]
+    pm['InitialTransformParameterFileName'] = ['NoInitialTransform']
+    pm['HowToCombineTransforms'] = ['Compose']
+    pm['FixedImageDimension'] = ['3']
+    pm['MovingImageDimension'] = ['3']
+    pm['FixedInternalImagePixelType'] = ['float']
+    pm['MovingInternalImagePixelType'] = ['float']
+    pm['Size'] = [str(n) for n in size]
+    pm['Index'] = ['0', '0', '0']
+    pm['Spacing'] = ['1', '1', '1']
+    pm['Origin'] = ['0', '0', '0']
+    pm['Direction'] = ['1', '0', '0', '0', '1', '0', '0', '0', '1']
+    pm['UseDirectionCosines'] = ['true']
+    pm['ResampleInterpolator'] = [interpolator]
+    pm['FinalBSplineInterpolationOrder'] = [order]
+    pm['Resampler'] = ['DefaultResampler']
+    pm['DefaultPixelValue'] = ['0']
+    pm['ResultImagePixelType'] = ['unsigned short']
+    pm['ResultImageFormat'] = ['nrrd']
+    return pm
+
+
+
+class TestDisplacementField(unittest.TestCase):
+
+    def setUp(self):
+        self.br = object.__new__(brainregister.BrainRegister)
+        self.br._range_cache = {}
+        self.br._displacement_field_pms = None
+        self.br._displacement_field = None
+
+        rng = np.random.default_rng(0)
+        # moving images SMALLER than the output - so its border resamples to default
+        self.imgs = []
+        for i in range(2):
+            arr = rng.random((18, 16, 20)) * 3000 + 100
+            img = sitk.SmoothingRecursiveGaussian(
+                    sitk.GetImageFromArray(arr.astype('float32')), 1.0)
+            self.imgs.append( sitk.Cast(img, sitk.sitkUInt16) )
+
+
+    def transformix(self, img, pm_list):
+        self.br.reuse_displacement_field()
+        return sitk.GetArrayFromImage( self.br.transform_image(img, pm_list) )
+
+
+    def test_resample_matches_transformix(self):
+        for interpolator, order in ( ('FinalBSplineInterpolator', '3'),
+                                     ('FinalBSplineInterpolator', '1'),
+                                     ('FinalLinearInterpolator', '3'),
+                                     ('FinalNearestNeighborInterpolator', '3') ):
+            with self.subTest(interpolator = interpolator, order = order):
+                pm_list = [ _affine_pm((22, 18, 20), interpolator, order) ]
+                expected = [ self.transformix(img, pm_list) for img in self.imgs ]
+
+                self.br.reuse_displacement_field(pm_list)
+                actual = [ sitk.GetArrayFromImage( self.br.transform_image(img, pm_list) )
+                             for img in self.imgs ]
+                self.assertIsNotNone(self.br._displacement_field) # field reused
+                self.br.reuse_displacement_field()
+
+                for e, a in zip(expected, actual):
+                    np.testing.assert_array_equal(a == 0, e == 0) # same border
+                     # float32 rounding of the field can flip the truncating cast
+                    self.assertLessEqual( np.abs(a.astype(int) - e).max(), 1 )
+
+
+    def test_field_not_written_to_cwd(self):
+        pm_list = [ _affine_pm((22, 18, 20), 'FinalBSplineInterpolator') ]
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                self.br.reuse_displacement_field(pm_list)
+                self.br.transform_image(self.imgs[0], pm_list)
+                self.br.reuse_displacement_field()
+                self.assertEqual(os.listdir(tmp), [])
+            finally:
+                os.chdir(cwd)
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+import SimpleITK as sitk
+
+import brainregister
+
+
+class TestGaussianHighPass(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.raw = ( rng.random((10, 24, 24)) * 1000 + 100 ).astype('uint16')
+        self.img = sitk.GetImageFromArray(self.raw)
+
+
+    def execute(self, filter_string):
+        pipeline = brainregister.ImageFilterPipeline(filter_string)
+        pipeline.set_image(self.img)
+        return pipeline.execute_pipeline()
+
+
+    def test_output_within_raw_range(self):
+        # 3D and planar (zero z kernel) gaussians
+        for filter_string in ('GH,2,2,1', 'GH,2,2,0'):
+            with self.subTest(filter_string = filter_string):
+                filtered = self.execute(filter_string)
+                arr = sitk.GetArrayViewFromImage(filtered)
+                self.assertEqual(filtered.GetPixelID(), self.img.GetPixelID())
+                self.assertGreaterEqual(arr.min(), self.raw.min())
+                self.assertLessEqual(arr.max(), self.raw.max())
+
+
+    def test_constant_image_is_flat(self):
+        self.img = sitk.Image(24, 24, 10, sitk.sitkUInt16) + 1000
+        arr = sitk.GetArrayViewFromImage( self.execute('GH,2,2,1') )
+        self.assertEqual(arr.min(), 1000)
+        self.assertEqual(arr.max(), 1000)
+
+
+    def test_edge_has_both_lobes(self):
+        # step edge along x : the high-pass dips below the mean on the dark side 
+         # and rises above it on the bright side - and is the mean far from it
+        step = np.full((10, 24, 48), 100, 'uint16')
+        step[:, :, 24:] = 1100
+        self.img = sitk.GetImageFromArray(step)
+        mean = step.mean()
+        line = sitk.GetArrayFromImage( self.execute('GH,2,2,1') )[5, 12].astype(float)
+        self.assertLess(line[23], mean - 100)    # negative lobe
+        self.assertGreater(line[23], step.min()) # - NOT flattened to the minimum
+        self.assertGreater(line[24], mean + 100) # positive lobe
+        self.assertAlmostEqual(line[4], mean, delta = 1)
+        self.assertAlmostEqual(line[43], mean, delta = 1)
+
+
+    def test_cast_does_not_wrap(self):
+        # BrainRegister.cast_image clamps to the range of the image it is given
+        br = object.__new__(brainregister.BrainRegister)
+        br._range_cache = {}
+        filtered = self.execute('GH,2,2,1')
+        cast = sitk.GetArrayViewFromImage( br.cast_image(filtered, filtered) )
+        self.assertGreaterEqual(cast.min(), self.raw.min())
+        self.assertLessEqual(cast.max(), self.raw.max())
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
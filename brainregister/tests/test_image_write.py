@@ -0,0 +1,98 @@
+import contextlib
+import io
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import SimpleITK as sitk
+
+import brainregister
+
+
+class TestImageWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+        self.br = object.__new__(brainregister.BrainRegister)
+        self.br._image_prefetch = {}
+        self.br._image_writer = None
+        self.br._image_writes = {}
+        self.br._image_write_lock = threading.Lock()
+
+        self.img = sitk.Image(4, 4, 4, sitk.sitkUInt16)
+        self.existing = self.dir / 'existing.nrrd'
+        sitk.WriteImage(self.img, str(self.existing))
+
+        self.release = threading.Event()
+        write_image = sitk.WriteImage
+        def slow_write(image, path, *args):
+            # the write of slow.nrrd only finishes once released
+            if Path(path).name == 'slow.nrrd':
+                self.assertTrue( self.release.wait(10) )
+            if Path(path).name == 'fail.nrrd':
+                raise RuntimeError('disk full')
+            write_image(image, path, *args)
+        patcher = mock.patch.object(brainregister.sitk, 'WriteImage', slow_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def tearDown(self):
+        self.release.set()
+        if self.br._image_writer is not None:
+            self.br._image_writer.shutdown()
+        self.tmp.cleanup()
+
+
+    def test_read_does_not_wait_for_other_writes(self):
+        self.br.save_image(self.img, self.dir / 'slow.nrrd')
+        self.br.load_image(self.existing) # would block until released
+        self.assertFalse(self.br._image_writes[str(self.dir / 'slow.nrrd')].done())
+        self.release.set()
+        self.br.wait_image_write()
+        self.assertTrue( (self.dir / 'slow.nrrd').exists() )
+
+
+    def test_read_waits_for_its_own_write(self):
+        path = self.dir / 'written.nrrd'
+        self.br.save_image(self.img, path)
+        self.assertEqual(self.br.load_image(path).GetSize(), (4, 4, 4))
+
+
+    def test_pool_waits_for_first_finished_write(self):
+        # two writers : the slow write is the OLDEST - but a later write has 
+         # finished, so the next save does not block on the slow one
+        with mock.patch.object(brainregister, '_IMAGE_WRITERS', 2):
+            self.br.save_image(self.img, self.dir / 'slow.nrrd')
+            self.br.save_image(self.img, self.dir / 'a.nrrd')
+            self.br.wait_image_write(self.dir / 'a.nrrd')
+            self.br.save_image(self.img, self.dir / 'b.nrrd')
+            self.br.save_image(self.img, self.dir / 'c.nrrd') # waits for b only
+            self.assertFalse(self.br._image_writes[str(self.dir / 'slow.nrrd')].done())
+            self.assertNotIn(str(self.dir / 'b.nrrd'), self.br._image_writes)
+            self.release.set()
+            self.br.wait_image_write()
+        for name in ('slow', 'a', 'b', 'c'):
+            self.assertTrue( (self.dir / (name+'.nrrd')).exists() )
+
+
+    def test_failed_write_reported_when_it_fails(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.br.save_image(self.img, self.dir / 'fail.nrrd')
+            future = self.br._image_writes[str(self.dir / 'fail.nrrd')]
+            self.assertIsNotNone( future.exception(10) )
+        self.assertIn('writing image failed', out.getvalue())
+        self.assertIn('fail.nrrd', out.getvalue())
+        with self.assertRaises(RuntimeError):
+            self.br.wait_image_write(self.dir / 'fail.nrrd')
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import SimpleITK as sitk
+
+import brainregister
+from brainregister.tests.test_displacement_field import _affine_pm
+
+
+class TestLabelImage(unittest.TestCase):
+
+    def setUp(self):
+        self.br = object.__new__(brainregister.BrainRegister)
+        self.br._range_cache = {}
+        self.br._label_cache = {}
+        self.br._displacement_field_pms = None
+        self.br._displacement_field = None
+
+        # Allen CCF style ids : above 2**16 AND 2**24 - float32 cannot hold them all
+        self.ids = np.array([0, 7, 65535, 65536, 16777217, 614454277], 'uint32')
+        rng = np.random.default_rng(0)
+        arr = self.ids[ rng.integers(0, len(self.ids), (12, 10, 14)) ]
+        self.anno = sitk.GetImageFromArray(arr)
+
+        self.identity = [ _affine_pm((14, 10, 12), 'FinalNearestNeighborInterpolator') ]
+        self.identity[0]['TransformParameters'] = [ '1', '0', '0', '0', '1', '0',
+                                                    '0', '0', '1', '0', '0', '0' ]
+
+
+    def test_round_trip(self):
+        img = self.br.transform_image(self.anno, self.identity)
+        self.assertEqual(img.GetPixelID(), sitk.sitkUInt32)
+        np.testing.assert_array_equal( sitk.GetArrayViewFromImage(img),
+                                       sitk.GetArrayViewFromImage(self.anno) )
+
+
+    def test_labels_kept_under_transform(self):
+        moved = [ _affine_pm((14, 10, 12), 'FinalNearestNeighborInterpolator') ]
+        img = self.br.transform_image(self.anno, moved)
+        self.assertTrue( np.isin(sitk.GetArrayViewFromImage(img), self.ids).all() )
+
+
+    def test_labels_scanned_once(self):
+        with mock.patch.object(brainregister.np, 'unique', wraps=np.unique) as unique:
+            img = self.br.transform_image(self.anno, self.identity)
+            self.br.transform_image(self.anno, self.identity)
+            self.br.transform_image(img, self.identity) # output reuses the labels
+        self.assertEqual(unique.call_count, 1)
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import SimpleITK as sitk
+
+import brainregister
+
+
+class _CountingBrainRegister(brainregister.BrainRegister):
+    # process_image_ds() reduced to the load - no registration files needed
+
+    def process_image_ds(self, index):
+        self.loaded.append( self.load_image(self.source_image_path[index]) )
+
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        tmp = Path(self.tmp.name)
+
+        self.br = object.__new__(_CountingBrainRegister)
+        self.br._image_reader = None
+        self.br._image_prefetch = {}
+        self.br._image_writes = {}
+        self.br._image_write_lock = threading.Lock()
+        self.br.downsampling_img = 'source'
+        self.br.source_image_path = []
+        self.br.source_image_path_ds = []
+        self.br.loaded = []
+
+        for i in range(3):
+            img = sitk.Image(4, 4, 4, sitk.sitkUInt16) + i
+            path = tmp / ('img'+str(i)+'.nrrd')
+            sitk.WriteImage(img, str(path))
+            self.br.source_image_path.append(path)
+            self.br.source_image_path_ds.append(tmp / ('ds_img'+str(i)+'.nrrd'))
+
+
+    def tearDown(self):
+        if self.br._image_reader is not None:
+            self.br._image_reader.shutdown()
+        self.tmp.cleanup()
+
+
+    def test_each_image_read_once(self):
+        # serial loop - the next image is prefetched before the current one loads
+        reads = []
+        read_image = brainregister._read_image
+        def counting_read(path):
+            reads.append(str(path))
+            return read_image(path)
+
+        with mock.patch.object(brainregister, '_read_image', counting_read), \
+             mock.patch.object(brainregister.os, 'cpu_count', lambda: 1):
+            self.br.process_images_ds(3, 'source')
+
+        self.assertEqual(sorted(reads),
+                         sorted(str(p) for p in self.br.source_image_path))
+        self.assertEqual( [ int(sitk.GetArrayViewFromImage(img)[0,0,0])
+                              for img in self.br.loaded ], [0, 1, 2] )
+        self.assertEqual(self.br._image_prefetch, {})
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()
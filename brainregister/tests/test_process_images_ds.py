@@ -0,0 +1,98 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import SimpleITK as sitk
+
+import brainregister
+
+
+def _blob(shape):
+    z, y, x = np.indices(shape).astype(float)
+    c = [n / 2 for n in shape]
+    r = sum( ((i - ci) / (n / 3))**2 for i, ci, n in zip((z, y, x), c, shape) )
+    return 1000 * np.exp(-r) + 200 * (x > c[2])
+
+
+def _write(arr, path, spacing):
+    img = sitk.GetImageFromArray(arr.astype('uint16'))
+    img.SetSpacing(spacing)
+    sitk.WriteImage(img, str(path), True)
+
+
+
+class TestProcessImagesDs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        tmp = Path(self.tmp.name)
+        os.chdir(tmp)
+        (tmp / 'src').mkdir()
+        (tmp / 'tgt').mkdir()
+
+        src_shape, tgt_shape = (40, 36, 44), (20, 18, 22)
+        _write(_blob(src_shape), tmp / 'src' / 'template.nrrd', (12.5,)*3)
+        for i in range(3): # different images - so a mixed-up index shows
+            _write(_blob(src_shape)[::-1] * (i+1) / 4,
+                   tmp / 'src' / ('img'+str(i)+'.nrrd'), (12.5,)*3)
+        _write(_blob(tgt_shape), tmp / 'tgt' / 'tt.nrrd', (25.0,)*3)
+        _write((_blob(tgt_shape) > 500) * 7, tmp / 'tgt' / 'ta.nrrd', (25.0,)*3)
+        (tmp / 'tgt' / 'tree.csv').write_text('id,name\n7,x\n')
+        (tmp / 'tgt' / 'tp.yaml').write_text(
+            'target-template-path: tt.nrrd\n'
+            'target-annotations-path:\n- ta.nrrd\n'
+            'target-structure-tree:\n- tree.csv\n'
+            'target-template-resolution:\n  x-um: 25.0\n  y-um: 25.0\n  z-um: 25.0\n'
+            'target-template-size:\n'
+            '  x: '+str(tgt_shape[2])+'\n  y: '+str(tgt_shape[1])+'\n  z: '+str(tgt_shape[0])+'\n'
+            'target-template-structure: CNS\n'
+            'target-template-orientation: LR:SI:PA\n' )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            brainregister.create_parameters_file( Path('src/template.nrrd'),
+                                                  output_dir = Path('br') )
+        self.yaml_path = tmp / 'br' / 'brainregister_parameters.yaml'
+        txt = self.yaml_path.read_text().replace(
+                'brainregister:resource/allen-ccf/ccf_parameters.yaml',
+                str(tmp / 'tgt' / 'tp.yaml') )
+        self.yaml_path.write_text(txt)
+        self.ds_paths = [ tmp / 'br' / 'downsampled_data' / ('ds_img'+str(i)+'.nrrd')
+                            for i in range(3) ]
+
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+    def downsample(self, cpu_count):
+        out = io.StringIO()
+        with mock.patch.object(brainregister.os, 'cpu_count', lambda: cpu_count), \
+             contextlib.redirect_stdout(out):
+            br = brainregister.BrainRegister(self.yaml_path)
+            br.register_transform_highres_to_downsampled()
+        arrs = [ sitk.GetArrayFromImage(sitk.ReadImage(str(p))) for p in self.ds_paths ]
+        for p in self.ds_paths:
+            p.unlink()
+        return out.getvalue(), arrs
+
+
+    def test_workers_match_serial(self):
+        log, serial = self.downsample(1)
+        self.assertNotIn('worker processes', log)
+        log, parallel = self.downsample(4)
+        self.assertIn('in 2 worker processes', log)
+        for s, p in zip(serial, parallel):
+            np.testing.assert_array_equal(p, s)
+
+
+
+
+if __name__ == '__main__':
+    unittest.main()